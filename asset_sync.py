@@ -0,0 +1,174 @@
+"""
+Sincronização dos arquivos de dados (KMLs e CSVs do Google Drive)
+Salve como: asset_sync.py
+
+Os arquivos de um lote são baixados em paralelo para arquivos temporários.
+O conteúdo novo só substitui o atual (com `os.replace`, de uma vez) quando o
+hash SHA-256 mudou; assim arquivos iguais mantêm a data de modificação e os
+caches compilados (kml_cache.py) continuam válidos.
+
+Cada arquivo fica registrado no manifesto `.cache/assets_manifest.json` com
+hash, tamanho e datas; `asset_version(nome)` devolve a versão atual para
+quem precisar invalidar dados derivados.
+
+Com ASSET_BASE_URL definido (ex.: um servidor de arquivos local ou de
+teste), os arquivos são buscados em `{ASSET_BASE_URL}/{arquivo}` via HTTP,
+com If-None-Match/If-Modified-Since: resposta 304 nem baixa o conteúdo.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import requests
+import gdown
+from disk_cache import CACHE_DIR
+from kml_cache import HASH_CHUNK_SIZE, file_hash
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+ASSET_BASE_URL = os.environ.get("ASSET_BASE_URL", "").rstrip("/")
+MANIFEST_PATH = os.path.join(CACHE_DIR, "assets_manifest.json")
+SYNC_WORKERS = 8
+DOWNLOAD_TIMEOUT = 60
+
+_manifest_lock = threading.Lock()
+
+# ======================
+# Manifesto
+# ======================
+def _read_manifest() -> Dict[str, dict]:
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_manifest(manifest: Dict[str, dict]) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Nome único por escrita: dois processos não dividem o arquivo temporário
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=CACHE_DIR, prefix="assets_manifest.",
+                                     suffix=".tmp", delete=False) as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    try:
+        os.replace(f.name, MANIFEST_PATH)
+    except OSError:
+        os.remove(f.name)
+        raise
+
+def get_manifest() -> Dict[str, dict]:
+    """Cópia do manifesto {nome: {path, sha256, size, updated_at, checked_at, ...}}"""
+    with _manifest_lock:
+        return _read_manifest()
+
+def asset_version(name: str) -> Optional[str]:
+    """Versão (prefixo do hash) do arquivo sincronizado, ou None se desconhecido"""
+    entry = get_manifest().get(name)
+    return entry["sha256"][:16] if entry else None
+
+# ======================
+# Download
+# ======================
+def _download_http(url: str, tmp_path: str, previous: dict) -> Optional[dict]:
+    """GET condicional; retorna metadados HTTP ou None se não mudou (304)"""
+    headers = {}
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(HASH_CHUNK_SIZE):
+                f.write(chunk)
+        return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+
+def _sync_one(name: str, file_id: str, path: str, previous: dict) -> Tuple[str, dict]:
+    """Baixa um arquivo e troca o atual só se o conteúdo mudou"""
+    tmp_path = f"{path}.tmp{threading.get_ident()}"
+    entry = dict(previous)
+    entry["path"] = path
+    entry["checked_at"] = time.time()
+    try:
+        if ASSET_BASE_URL:
+            meta = _download_http(f"{ASSET_BASE_URL}/{os.path.basename(path)}", tmp_path,
+                                  previous if os.path.exists(path) else {})
+            if meta is None:
+                logger.info(f"{path}: sem alterações (304)")
+                return name, entry
+            entry.update(meta)
+        else:
+            url = f"https://drive.google.com/uc?id={file_id}"
+            if gdown.download(url, tmp_path, quiet=True, fuzzy=True) is None:
+                raise Exception("download não retornou arquivo")
+
+        digest = file_hash(tmp_path)
+        if os.path.exists(path) and previous.get("sha256") == digest and previous.get("size") == os.path.getsize(path):
+            os.remove(tmp_path)
+            logger.info(f"{path}: conteúdo igual, mantido")
+        else:
+            os.replace(tmp_path, path)
+            entry["updated_at"] = time.time()
+            logger.info(f"{path}: nova versão {digest[:16]}")
+        entry["sha256"] = digest
+        entry["size"] = os.path.getsize(path)
+        return name, entry
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def sync_assets(assets: Dict[str, Tuple[str, str]]) -> Dict[str, dict]:
+    """
+    Sincroniza vários arquivos em paralelo
+
+    Args:
+        assets: {nome: (file_id do Google Drive, caminho local)}
+
+    Returns:
+        dict: Entradas do manifesto dos arquivos disponíveis. Se o download
+        falhar e já existir uma cópia local, ela continua sendo usada; só
+        arquivos sem nenhuma cópia ficam de fora do resultado.
+    """
+    manifest = get_manifest()
+    with ThreadPoolExecutor(max_workers=min(SYNC_WORKERS, max(len(assets), 1)), thread_name_prefix="assets") as pool:
+        futures = {
+            name: pool.submit(_sync_one, name, file_id, path, manifest.get(name, {}))
+            for name, (file_id, path) in assets.items()
+        }
+
+    results = {}
+    for name, future in futures.items():
+        path = assets[name][1]
+        try:
+            _, entry = future.result()
+            results[name] = entry
+        except Exception as e:
+            logger.error(f"Erro ao sincronizar {path}: {e}")
+            if os.path.exists(path):
+                entry = dict(manifest.get(name, {}))
+                entry.setdefault("path", path)
+                entry.setdefault("sha256", file_hash(path))
+                entry.setdefault("size", os.path.getsize(path))
+                results[name] = entry
+
+    with _manifest_lock:
+        current = _read_manifest()
+        current.update(results)
+        _write_manifest(current)
+    return results
+
+def sync_asset(name: str, file_id: str, path: str) -> str:
+    """Sincroniza um único arquivo; levanta exceção se não houver cópia local"""
+    if name not in sync_assets({name: (file_id, path)}):
+        raise Exception(f"Falha no download do arquivo {path}")
+    return path
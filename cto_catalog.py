@@ -0,0 +1,183 @@
+"""
+Catálogo único de CTOs compartilhado por todas as páginas
+Salve como: cto_catalog.py
+
+O KML de CTOs é baixado e processado uma única vez por processo. O catálogo
+guarda os registros, o índice espacial e os Plus Codes já calculados, e é
+substituído de forma atômica quando atualizado.
+"""
+
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+import streamlit as st
+from openlocationcode import openlocationcode as olc
+from geo_index import CTOGridIndex, build_cto_index
+from kml_parser import iter_placemarks, decode_coordinates
+from kml_cache import load_ctos_compiled, file_hash
+from asset_sync import sync_asset, asset_version
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+FILE_ID_CTOS = "1EcKNk2yqHDEMMXJZ17fT0flPV19HDhKJ"
+CTOS_KML_PATH = "ctos.kml"
+CATALOG_TTL = 3600  # segundos
+
+# ======================
+# Funções Auxiliares
+# ======================
+def download_ctos_file(file_id: str = FILE_ID_CTOS, output: str = CTOS_KML_PATH) -> str:
+    """Sincroniza o KML (só substitui o atual se o conteúdo mudou)"""
+    return sync_asset("ctos", file_id, output)
+
+def load_ctos_from_kml(path: str) -> List[dict]:
+    """Lê as CTOs do KML com o Plus Code de cada uma já calculado"""
+    ctos = []
+    for placemark in iter_placemarks(path):
+        coords = decode_coordinates(placemark["coordinates"] or "")
+        if len(coords):
+            lat, lon = coords[0].tolist()
+            ctos.append({
+                "name": placemark["name"] or "CTO",
+                "desc": placemark["desc"] or "",
+                "lat": lat,
+                "lon": lon,
+                "pluscode": olc.encode(lat, lon)
+            })
+    logger.info(f"Carregados {len(ctos)} CTOs do arquivo KML")
+    return ctos
+
+# ======================
+# Catálogo
+# ======================
+class CTOCatalog:
+    """
+    Registros, índice espacial e Plus Codes de uma versão do KML de CTOs
+
+    Args:
+        records: CTOs (name, desc, lat, lon, pluscode)
+        version: Versão do KML (hash do conteúdo); resultados derivados do
+            catálogo guardados fora dele usam para saber se ficaram velhos
+    """
+
+    def __init__(self, records: List[dict], version: str = ""):
+        self.records = records
+        self.version = version
+        self.index: CTOGridIndex = build_cto_index(records)
+        self.loaded_at = time.time()
+        # Candidatas por solicitação; descartadas junto com o catálogo
+        self._candidates_memo: Dict[tuple, List[dict]] = {}
+        self._memo_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def find_nearest(self, lat: float, lon: float, max_radius: float = 400.0) -> List[dict]:
+        """CTOs (sem CDOIs) dentro do raio, ordenadas por distância"""
+        return self.index.query_radius(lat, lon, max_radius)
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius: Optional[float] = None) -> List[dict]:
+        """As `k` CTOs (sem CDOIs) mais próximas"""
+        return self.index.query_nearest(lat, lon, k, max_radius=max_radius)
+
+    def candidates_for_requests(self, requests: List[Tuple[str, float, float]],
+                                max_radius: float = 400.0) -> Dict[str, List[dict]]:
+        """
+        CTOs candidatas para várias solicitações em uma única passada vetorizada
+
+        Args:
+            requests: Lista de (id da solicitação, lat, lon)
+            max_radius: Raio de busca em metros
+
+        Returns:
+            dict: {id da solicitação: CTOs ordenadas por distância}
+
+        O resultado fica memorizado por solicitação enquanto este catálogo
+        estiver em uso; só as solicitações novas entram no cálculo.
+        """
+        keys = {request_id: (request_id, lat, lon, max_radius) for request_id, lat, lon in requests}
+        with self._memo_lock:
+            missing = [key for key in keys.values() if key not in self._candidates_memo]
+
+        if missing:
+            computed = self.index.batch_query_radius([(key[1], key[2]) for key in missing], max_radius)
+            with self._memo_lock:
+                self._candidates_memo.update(zip(missing, computed))
+
+        with self._memo_lock:
+            return {request_id: [dict(c) for c in self._candidates_memo[key]] for request_id, key in keys.items()}
+
+
+class _CatalogHolder:
+    """Referência compartilhada ao catálogo atual (trocada sob lock)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Uma carga do KML por vez; quem chega durante a renovação segue com o atual
+        self.build_lock = threading.Lock()
+        self.catalog: Optional[CTOCatalog] = None
+
+
+@st.cache_resource
+def _get_holder() -> _CatalogHolder:
+    return _CatalogHolder()
+
+def _build_catalog() -> CTOCatalog:
+    download_ctos_file(FILE_ID_CTOS, CTOS_KML_PATH)
+    version = asset_version("ctos") or file_hash(CTOS_KML_PATH)[:16]
+    return CTOCatalog(load_ctos_compiled(CTOS_KML_PATH, load_ctos_from_kml), version)
+
+def refresh_cto_catalog() -> Optional[CTOCatalog]:
+    """
+    Recarrega o KML e troca o catálogo de uma vez
+
+    O novo catálogo é montado fora do lock; as sessões continuam usando o
+    anterior até a troca. Em caso de erro o catálogo atual é mantido.
+
+    Returns:
+        CTOCatalog: O novo catálogo, ou None se a recarga falhou
+    """
+    holder = _get_holder()
+    try:
+        catalog = _build_catalog()
+    except Exception as e:
+        logger.error(f"Erro ao recarregar catálogo de CTOs, mantendo versão atual: {e}")
+        return None
+    with holder.lock:
+        holder.catalog = catalog
+    logger.info(f"Catálogo de CTOs atualizado: {len(catalog)} CTOs")
+    return catalog
+
+def get_cto_catalog() -> CTOCatalog:
+    """Retorna o catálogo do processo, carregando ou renovando após o TTL"""
+    holder = _get_holder()
+    catalog = holder.catalog
+    if catalog is not None and time.time() - catalog.loaded_at < CATALOG_TTL:
+        return catalog
+
+    # Catálogo vencido: outra sessão já está renovando, segue com o atual
+    if not holder.build_lock.acquire(blocking=catalog is None):
+        return catalog
+    try:
+        # Outra sessão pode ter carregado enquanto esperávamos
+        catalog = holder.catalog
+        if catalog is not None and time.time() - catalog.loaded_at < CATALOG_TTL:
+            return catalog
+        try:
+            new_catalog = _build_catalog()
+        except Exception as e:
+            if catalog is None:
+                raise
+            logger.error(f"Erro ao renovar catálogo de CTOs, mantendo versão anterior: {e}")
+            catalog.loaded_at = time.time()
+            return catalog
+        # Montado fora do lock do holder; só a troca é feita sob ele
+        with holder.lock:
+            holder.catalog = new_catalog
+        return new_catalog
+    finally:
+        holder.build_lock.release()
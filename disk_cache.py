@@ -0,0 +1,152 @@
+"""
+Cache persistente em SQLite com chaves por coordenadas arredondadas
+Salve como: disk_cache.py
+
+As coordenadas da chave são encaixadas numa grade de poucos metros, então
+pontos vizinhos (casas ao lado) reutilizam o mesmo resultado. O cache
+sobrevive a reinícios e ao botão "Atualizar Arquivos", remove as entradas
+menos usadas (LRU) ao passar do limite e conta acertos/erros.
+"""
+
+import os
+import json
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+CACHE_DIR = os.environ.get("VIABILIDADE_CACHE_DIR", ".cache")
+reference_lat = -28.6775
+
+# Fração das entradas removida de uma vez quando o limite é atingido
+EVICTION_FRACTION = 0.1
+
+# ======================
+# Cache
+# ======================
+class SnappedDiskCache:
+    """
+    Cache chave/valor (JSON) cuja chave é uma sequência de pontos (lat, lon)
+
+    Args:
+        name: Nome do arquivo (.sqlite) dentro de CACHE_DIR
+        grid_m: Tamanho da célula da grade em metros
+        max_entries: Limite de entradas antes da remoção LRU
+    """
+
+    def __init__(self, name: str, grid_m: float = 5.0, max_entries: int = 50000):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite")
+        self.grid_m = grid_m
+        self.max_entries = max_entries
+        self._step_lat = grid_m / 111320.0
+        self._step_lon = self._step_lat / math.cos(math.radians(reference_lat))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache(last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def snap(self, lat: float, lon: float) -> Tuple[int, int]:
+        """Célula da grade que contém o ponto"""
+        return round(lat / self._step_lat), round(lon / self._step_lon)
+
+    def make_key(self, *points: Tuple[float, float]) -> str:
+        return ";".join("%d,%d" % self.snap(lat, lon) for lat, lon in points)
+
+    def get(self, *points: Tuple[float, float]) -> Optional[Any]:
+        key = self.make_key(*points)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def get_near(self, lat: float, lon: float, cells: int = 1) -> Optional[Any]:
+        """
+        Valor de uma chave de um único ponto na célula do ponto ou vizinhas
+
+        A própria célula tem prioridade; depois vale a vizinha mais próxima do
+        centro. Evita que pontos a poucos metros, mas do outro lado de uma
+        borda da grade, voltem a consultar o serviço.
+        """
+        row, col = self.snap(lat, lon)
+        frac_lat = lat / self._step_lat - row
+        frac_lon = lon / self._step_lon - col
+        offsets = sorted(
+            ((dr, dc) for dr in range(-cells, cells + 1) for dc in range(-cells, cells + 1)),
+            key=lambda o: (o[0] - frac_lat) ** 2 + (o[1] - frac_lon) ** 2
+        )
+        keys = ["%d,%d" % (row + dr, col + dc) for dr, dc in offsets]
+        with self._lock:
+            placeholders = ",".join("?" * len(keys))
+            found = dict(self._conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders})", keys
+            ).fetchall())
+            key = next((k for k in keys if k in found), None)
+            if key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(found[key])
+
+    def put(self, *points: Tuple[float, float], value: Any) -> None:
+        key = self.make_key(*points)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._conn.commit()
+            # Contagem aproximada (substituições também contam); _evict recalcula
+            if cursor.rowcount:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove as entradas acessadas há mais tempo (chamada com o lock)"""
+        self._count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        n = excess + int(self.max_entries * EVICTION_FRACTION)
+        self._conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)", (n,)
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        logger.info(f"Cache {self.path}: {n} entradas antigas removidas")
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._count
+        }
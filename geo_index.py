@@ -0,0 +1,212 @@
+"""
+Índice espacial e cálculo vetorizado de distâncias para CTOs
+Salve como: geo_index.py
+
+As coordenadas das CTOs ficam em vetores float64 contíguos. As distâncias são
+calculadas com haversine vetorizado (NumPy) e uma grade fixa (buckets) sobre
+coordenadas projetadas limita as consultas por raio às células próximas.
+
+Limite de erro
+--------------
+O haversine usa o raio gaussiano local da Terra (sqrt(M·N) do elipsoide WGS84)
+na latitude média das CTOs. Contra a distância geodésica no elipsoide, o erro
+relativo é no máximo e'²·cos²(lat)/2 + 0.01% ≈ 0.35% no equador e ≈ 0.27% na
+nossa região (lat ≈ -28.7°), ou seja, menos de 10m para 3.5km e menos de 1.5m
+para 500m. Com `refine=True` as 10 melhores candidatas são recalculadas pelo
+geopy (geodésica exata), então a sobra de +50m dos auditores nunca é consumida
+pelo erro do cálculo.
+"""
+
+import math
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from geopy.distance import geodesic
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+DEFAULT_CELL_SIZE_M = 500.0
+
+# Quantidade de candidatas finais recalculadas com geodésica exata
+REFINE_TOP = 10
+
+# Erro relativo máximo do haversine contra a geodésica (ver docstring do módulo)
+MAX_RELATIVE_ERROR = 0.0035
+
+# Folga aplicada ao filtro da grade (cobre o erro do haversine e da projeção)
+PROJECTION_SLACK = 0.02
+
+# Linhas da matriz de distâncias calculadas por vez nas consultas em lote
+BATCH_CHUNK_ROWS = 256
+
+# ======================
+# Kernel de Distância
+# ======================
+def local_earth_radius(lat: float) -> float:
+    """Raio gaussiano (média geométrica dos raios de curvatura) na latitude"""
+    s2 = math.sin(math.radians(lat)) ** 2
+    w = 1 - WGS84_E2 * s2
+    m = WGS84_A * (1 - WGS84_E2) / w ** 1.5
+    n = WGS84_A / math.sqrt(w)
+    return math.sqrt(m * n)
+
+def haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray, radius: float) -> np.ndarray:
+    """Distâncias (m) de um ponto até todos os pontos dos vetores, em uma expressão"""
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    h = (np.sin((phi2 - phi1) * 0.5) ** 2
+         + math.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lons - lon) * 0.5) ** 2)
+    return 2 * radius * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+def haversine_matrix_m(src_lats: np.ndarray, src_lons: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+                       radius: float) -> np.ndarray:
+    """Matriz (origens × destinos) de distâncias em metros"""
+    phi1 = np.radians(src_lats)[:, None]
+    phi2 = np.radians(lats)[None, :]
+    dlon = np.radians(lons[None, :] - src_lons[:, None])
+    h = np.sin((phi2 - phi1) * 0.5) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlon * 0.5) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+# ======================
+# Índice em Grade
+# ======================
+class CTOGridIndex:
+    """
+    Índice vetorizado para CTOs
+
+    As coordenadas são projetadas (equiretangular) em torno da latitude média
+    das CTOs e agrupadas em células quadradas de `cell_size_m` metros.
+    """
+
+    def __init__(self, ctos: List[dict], cell_size_m: float = DEFAULT_CELL_SIZE_M):
+        self.ctos = ctos
+        self.cell_size_m = cell_size_m
+        self.lats = np.ascontiguousarray([c["lat"] for c in ctos], dtype=np.float64)
+        self.lons = np.ascontiguousarray([c["lon"] for c in ctos], dtype=np.float64)
+        self.ref_lat = float(self.lats.mean()) if ctos else 0.0
+        self.radius = local_earth_radius(self.ref_lat)
+        self._cos_ref = math.cos(math.radians(self.ref_lat))
+
+        cx, cy = self._cell_of(*self._project(self.lats, self.lons))
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i, key in enumerate(zip(cx.tolist(), cy.tolist())):
+            buckets.setdefault(key, []).append(i)
+        self._cells = {key: np.array(ids, dtype=np.intp) for key, ids in buckets.items()}
+
+        logger.info(f"Índice espacial: {len(ctos)} CTOs em {len(self._cells)} células")
+
+    def __len__(self) -> int:
+        return len(self.ctos)
+
+    def _project(self, lats, lons):
+        x = self.radius * np.radians(lons) * self._cos_ref
+        y = self.radius * np.radians(lats)
+        return x, y
+
+    def _cell_of(self, x, y):
+        return np.floor(x / self.cell_size_m).astype(np.int64), np.floor(y / self.cell_size_m).astype(np.int64)
+
+    def _candidates(self, lat: float, lon: float, radius: float) -> np.ndarray:
+        """Índices das CTOs nas células que cobrem o raio"""
+        x, y = self._project(np.float64(lat), np.float64(lon))
+        cx, cy = (int(v) for v in self._cell_of(x, y))
+        reach = int(math.ceil(radius / self.cell_size_m))
+        if (2 * reach + 1) ** 2 >= len(self._cells):
+            # Raio maior que a área ocupada: percorrer só as células existentes
+            found = [ids for (i, j), ids in self._cells.items()
+                     if abs(i - cx) <= reach and abs(j - cy) <= reach]
+        else:
+            found = [self._cells[key] for key in
+                     ((i, j) for i in range(cx - reach, cx + reach + 1) for j in range(cy - reach, cy + reach + 1))
+                     if key in self._cells]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+
+    def distances_from(self, lat: float, lon: float) -> np.ndarray:
+        """Distâncias (m) do ponto até todas as CTOs"""
+        return haversine_m(lat, lon, self.lats, self.lons, self.radius)
+
+    def _to_results(self, lat: float, lon: float, ids: np.ndarray, dists: np.ndarray, refine: bool) -> List[dict]:
+        order = np.argsort(dists, kind="stable")
+        ids, dists = ids[order], dists[order]
+        if refine and len(dists):
+            # Recalcula as primeiras REFINE_TOP (e empates dentro da margem de erro) pela geodésica
+            cutoff = dists[min(REFINE_TOP, len(dists)) - 1] * (1 + 2 * MAX_RELATIVE_ERROR)
+            n = int(np.searchsorted(dists, cutoff, side="right"))
+            dists = dists.copy()
+            for pos in range(n):
+                i = int(ids[pos])
+                dists[pos] = geodesic((lat, lon), (self.lats[i], self.lons[i])).meters
+            head = np.argsort(dists[:n], kind="stable")
+            ids[:n], dists[:n] = ids[:n][head], dists[:n][head]
+        return [{**self.ctos[i], "distance": d} for i, d in zip(ids.tolist(), dists.tolist())]
+
+    def _within(self, lat: float, lon: float, ids: np.ndarray, dists: np.ndarray, max_radius: float):
+        """Filtra pelo raio; CTOs na faixa de erro da borda são decididas pela geodésica"""
+        mask = dists <= max_radius * (1 + MAX_RELATIVE_ERROR)
+        ids, dists = ids[mask], dists[mask].copy()
+        for pos in np.flatnonzero(dists > max_radius * (1 - MAX_RELATIVE_ERROR)).tolist():
+            i = int(ids[pos])
+            dists[pos] = geodesic((lat, lon), (self.lats[i], self.lons[i])).meters
+        keep = dists <= max_radius
+        return ids[keep], dists[keep]
+
+    def query_radius(self, lat: float, lon: float, max_radius: float, refine: bool = True) -> List[dict]:
+        """
+        Retorna CTOs dentro de `max_radius` metros, ordenadas por distância
+
+        Cada item é uma cópia da CTO com a chave "distance" (em metros).
+        """
+        if not self.ctos:
+            return []
+        ids = self._candidates(lat, lon, max_radius * (1 + PROJECTION_SLACK))
+        dists = haversine_m(lat, lon, self.lats[ids], self.lons[ids], self.radius)
+        ids, dists = self._within(lat, lon, ids, dists, max_radius)
+        return self._to_results(lat, lon, ids, dists, refine)
+
+    def batch_query_radius(self, points: List[Tuple[float, float]], max_radius: float,
+                           refine: bool = True) -> List[List[dict]]:
+        """
+        `query_radius` para vários pontos de uma vez
+
+        As distâncias saem de uma matriz pontos × CTOs calculada em blocos de
+        BATCH_CHUNK_ROWS linhas; o resultado segue a ordem de `points`.
+        """
+        if not self.ctos or not points:
+            return [[] for _ in points]
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        all_ids = np.arange(len(self.ctos))
+        results = []
+        for start in range(0, len(coords), BATCH_CHUNK_ROWS):
+            chunk = coords[start:start + BATCH_CHUNK_ROWS]
+            matrix = haversine_matrix_m(chunk[:, 0], chunk[:, 1], self.lats, self.lons, self.radius)
+            for (lat, lon), row in zip(chunk.tolist(), matrix):
+                near = np.flatnonzero(row <= max_radius * (1 + MAX_RELATIVE_ERROR))
+                ids, dists = self._within(lat, lon, all_ids[near], row[near], max_radius)
+                results.append(self._to_results(lat, lon, ids, dists, refine))
+        return results
+
+    def query_nearest(self, lat: float, lon: float, k: int, max_radius: Optional[float] = None,
+                      refine: bool = True) -> List[dict]:
+        """Retorna as `k` CTOs mais próximas (opcionalmente limitadas a `max_radius`)"""
+        if not self.ctos or k <= 0:
+            return []
+        dists = self.distances_from(lat, lon)
+        ids = np.arange(len(dists))
+        if max_radius is not None:
+            ids, dists = self._within(lat, lon, ids, dists, max_radius)
+        if len(dists) > k:
+            kth = dists[np.argpartition(dists, k - 1)[k - 1]]
+            top = np.flatnonzero(dists <= kth * (1 + 2 * MAX_RELATIVE_ERROR))
+            ids, dists = ids[top], dists[top]
+        return self._to_results(lat, lon, ids, dists, refine)[:k]
+
+
+def build_cto_index(ctos: List[dict], cell_size_m: float = DEFAULT_CELL_SIZE_M) -> CTOGridIndex:
+    """Constrói o índice ignorando CDOIs (nunca são oferecidas ao cliente)"""
+    ctos = [c for c in ctos if not c["name"].upper().startswith("CDOI")]
+    return CTOGridIndex(ctos, cell_size_m)
@@ -0,0 +1,156 @@
+"""
+Conversão de Plus Codes e busca de endereço (LocationIQ)
+Salve como: geocoding.py
+
+Os endereços ficam num cache SQLite persistente com grade de 5m; um ponto
+novo reutiliza o endereço da sua célula ou de uma vizinha (até ~10m), então
+casas vizinhas e reaberturas da página não consultam a LocationIQ. Erros e
+respostas 429 não são guardados nem esperados: a página segue e o endereço
+é buscado de novo na próxima abertura.
+
+As consultas passam pela fila da LocationIQ em rate_limiter.py; a página
+espera no máximo GEOCODE_WAIT segundos e depois mostra um aviso.
+
+Se o arquivo de ruas/bairros (offline_geocoder.py) existir, ele é a fonte
+principal e a LocationIQ só é consultada quando não há rua próxima.
+"""
+
+import os
+import re
+import logging
+import threading
+from functools import lru_cache
+from typing import Optional, Tuple
+import requests
+from openlocationcode import openlocationcode as olc
+from disk_cache import SnappedDiskCache
+from rate_limiter import PendingResult, get_limiter
+from offline_geocoder import GEOCODER_DATA_PATH, OfflineGeocoder, load_offline_geocoder
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+LOCATIONIQ_KEY = "pk.66f355328aaad40fe69b57c293f66815"
+reference_lat = -28.6775
+reference_lon = -49.3696
+GEOCODE_TIMEOUT = 10
+GEOCODE_WAIT = 1.0  # segundos que a página espera antes de mostrar o aviso
+GEOCODE_PENDING_MESSAGE = "Buscando endereço... (atualize a página em instantes)"
+GEOCODE_CACHE_GRID_M = 5.0
+GEOCODE_CACHE_MAX_ENTRIES = 100000
+PLUS_CODE_PATTERN = re.compile(r'^[23456789CFGHJMPQRVWX]{4,8}\+[23456789CFGHJMPQRVWX]{2,3}$')
+PLUS_CODE_CACHE_SIZE = 200000
+
+geocode_cache = SnappedDiskCache("geocode", grid_m=GEOCODE_CACHE_GRID_M, max_entries=GEOCODE_CACHE_MAX_ENTRIES)
+
+_offline_lock = threading.Lock()
+_offline_state = {"loaded": False, "geocoder": None}
+
+# ======================
+# Funções de Geolocalização
+# ======================
+def validate_coordinates(lat: float, lon: float) -> bool:
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+def validate_plus_code(plus_code: str) -> bool:
+    return bool(PLUS_CODE_PATTERN.match(plus_code.upper().strip()))
+
+@lru_cache(maxsize=PLUS_CODE_CACHE_SIZE)
+def pluscode_to_coords(pluscode: str) -> Tuple[float, float]:
+    """
+    Centro da célula do Plus Code (resultado guardado por código)
+
+    Códigos curtos são recuperados perto de Criciúma.
+
+    Raises:
+        ValueError: Plus Code em formato inválido ou coordenadas fora do globo
+    """
+    pluscode = pluscode.strip().upper()
+    if not validate_plus_code(pluscode):
+        raise ValueError(f"Formato de Plus Code inválido: {pluscode}")
+    if not olc.isFull(pluscode):
+        pluscode = olc.recoverNearest(pluscode, reference_lat, reference_lon)
+    decoded = olc.decode(pluscode)
+    lat = (decoded.latitudeLo + decoded.latitudeHi) / 2
+    lon = (decoded.longitudeLo + decoded.longitudeHi) / 2
+    if not validate_coordinates(lat, lon):
+        raise ValueError("Coordenadas resultantes inválidas")
+    return lat, lon
+
+def pluscode_to_coords_or_none(pluscode: str) -> Tuple[Optional[float], Optional[float]]:
+    """Como pluscode_to_coords, mas retorna (None, None) se o código não converter"""
+    try:
+        return pluscode_to_coords(pluscode)
+    except Exception as e:
+        logger.error(f"Erro ao converter Plus Code: {e}")
+        return None, None
+
+def get_offline_geocoder() -> Optional[OfflineGeocoder]:
+    """Geocodificador offline (carregado uma vez), ou None se o arquivo não existe"""
+    if not _offline_state["loaded"]:
+        with _offline_lock:
+            if not _offline_state["loaded"]:
+                if os.path.exists(GEOCODER_DATA_PATH):
+                    try:
+                        _offline_state["geocoder"] = load_offline_geocoder(GEOCODER_DATA_PATH)
+                    except Exception as e:
+                        logger.error(f"Erro ao carregar {GEOCODER_DATA_PATH}: {e}")
+                _offline_state["loaded"] = True
+    return _offline_state["geocoder"]
+
+def fetch_address(lat: float, lon: float) -> Tuple[Optional[str], Optional[str]]:
+    """Consulta a LocationIQ (sem cache); retorna (endereço, None) ou (None, erro)"""
+    url = f"https://us1.locationiq.com/v1/reverse?key={LOCATIONIQ_KEY}&lat={lat}&lon={lon}&format=json"
+    try:
+        response = requests.get(url, timeout=GEOCODE_TIMEOUT)
+        if response.status_code == 200:
+            return response.json().get("display_name", "Endereço não encontrado"), None
+        if response.status_code == 429:
+            logger.warning("LocationIQ: limite de requisições atingido")
+            return None, "Endereço indisponível no momento (limite da API)"
+        return None, f"Erro na consulta: HTTP {response.status_code}"
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Erro ao consultar LocationIQ: {e}")
+        return None, f"Erro na consulta: {str(e)}"
+
+def _fetch_and_store(lat: float, lon: float) -> Tuple[Optional[str], Optional[str]]:
+    # Um vizinho enfileirado antes pode ter preenchido a célula
+    cached = geocode_cache.get_near(lat, lon)
+    if cached:
+        return cached, None
+    address, error = fetch_address(lat, lon)
+    if address is not None:
+        geocode_cache.put((lat, lon), value=address)
+    return address, error
+
+def lookup_address_async(lat: float, lon: float) -> PendingResult:
+    """(endereço, erro) offline ou do cache na hora; senão da LocationIQ pela fila com limite de taxa"""
+    geocoder = get_offline_geocoder()
+    address = geocoder.reverse(lat, lon) if geocoder is not None else None
+    if address:
+        return PendingResult.resolved((address, None))
+
+    cached = geocode_cache.get_near(lat, lon)
+    if cached:
+        return PendingResult.resolved((cached, None))
+    return get_limiter("locationiq").submit(_fetch_and_store, lat, lon, key=geocode_cache.make_key((lat, lon)))
+
+def lookup_address(lat: float, lon: float, wait: Optional[float] = None) -> Optional[str]:
+    """Endereço do ponto; None se a LocationIQ falhou ou não respondeu em `wait` s"""
+    return lookup_address_async(lat, lon).result(timeout=wait, default=(None, None))[0]
+
+def pending_address(pending: PendingResult, wait: float) -> str:
+    """Endereço de uma consulta já enviada, esperando no máximo `wait` s; aviso se ainda na fila"""
+    address, error = pending.result(timeout=max(0.0, wait), default=(None, GEOCODE_PENDING_MESSAGE))
+    return address if address is not None else error
+
+def reverse_geocode(lat: float, lon: float, wait: float = GEOCODE_WAIT) -> str:
+    """
+    Endereço para exibição, esperando no máximo `wait` s
+
+    Se a consulta ainda estiver na fila, devolve um aviso; ela continua em
+    segundo plano e o endereço sai do cache na próxima execução da página.
+    """
+    return pending_address(lookup_address_async(lat, lon), wait)
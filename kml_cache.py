@@ -0,0 +1,203 @@
+"""
+Cache compilado (binário) dos KMLs de CTOs e linhas de projeto
+Salve como: kml_cache.py
+
+Cada KML é convertido uma vez para arrays NumPy (.npy) numa pasta cujo nome
+leva o hash SHA-256 do conteúdo do arquivo. Nas cargas seguintes, se o KML
+não mudou, os arrays são abertos com memory-map e o XML nem é lido.
+
+- Linhas: `coords` (N x 2, lat/lon de todos os vértices) e `offsets`
+  (início de cada linha em `coords`, com o total no final)
+- CTOs: colunas name, desc, lat, lon e pluscode
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from disk_cache import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+KML_CACHE_DIR = os.path.join(CACHE_DIR, "kml")
+HASH_CHUNK_SIZE = 1 << 20
+
+CTO_COLUMNS = ("name", "desc", "lat", "lon", "pluscode")
+
+# ======================
+# Linhas Compactadas
+# ======================
+class PackedLines:
+    """
+    Várias linhas guardadas em dois arrays contíguos
+
+    Iterar devolve cada linha como array (n x 2) de (lat, lon), sem cópia.
+    """
+
+    def __init__(self, coords: np.ndarray, offsets: np.ndarray):
+        self.coords = coords
+        self.offsets = offsets
+
+    @classmethod
+    def from_lines(cls, lines: Sequence[Sequence[Tuple[float, float]]]) -> "PackedLines":
+        sizes = np.fromiter((len(line) for line in lines), dtype=np.int64, count=len(lines))
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        if len(lines):
+            coords = np.concatenate([np.asarray(line, dtype=np.float64).reshape(-1, 2) for line in lines])
+        else:
+            coords = np.empty((0, 2), dtype=np.float64)
+        return cls(coords, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield self.coords[start:end]
+
+    @property
+    def n_points(self) -> int:
+        return int(self.offsets[-1])
+
+# ======================
+# Arquivos
+# ======================
+def file_hash(path: str) -> str:
+    """SHA-256 do conteúdo do arquivo"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _compiled_dir(path: str, digest: str) -> str:
+    return os.path.join(KML_CACHE_DIR, f"{os.path.basename(path)}-{digest[:16]}")
+
+def _read_arrays(target: str, names: Sequence[str]) -> Dict[str, np.ndarray]:
+    return {name: np.load(os.path.join(target, f"{name}.npy"), mmap_mode="r") for name in names}
+
+def _write_arrays(path: str, target: str, arrays: Dict[str, np.ndarray]) -> None:
+    """Grava numa pasta temporária, troca de uma vez e remove versões antigas"""
+    os.makedirs(KML_CACHE_DIR, exist_ok=True)
+    tmp = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # Outro processo compilou o mesmo conteúdo ao mesmo tempo
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    prefix = f"{os.path.basename(path)}-"
+    for entry in os.listdir(KML_CACHE_DIR):
+        old = os.path.join(KML_CACHE_DIR, entry)
+        if entry.startswith(prefix) and old != target and ".tmp" not in entry:
+            shutil.rmtree(old, ignore_errors=True)
+
+def compile_lines(path: str, parser: Callable[[str], Sequence], digest: str) -> str:
+    """Lê o KML e grava a versão compilada (roda nos processos do pool)"""
+    target = _compiled_dir(path, digest)
+    if not os.path.isdir(target):
+        packed = PackedLines.from_lines(parser(path))
+        _write_arrays(path, target, {"coords": packed.coords, "offsets": packed.offsets})
+    return target
+
+def load_many_lines_compiled(paths: Dict[str, str], parser: Callable[[str], Sequence]) -> Dict[str, PackedLines]:
+    """
+    Linhas de vários KMLs, compilando os que mudaram em processos separados
+
+    O `parser` precisa ser uma função de módulo (enviada aos processos). Os
+    processos só gravam os arrays em disco; o resultado volta por memory-map,
+    sem serializar a geometria. Arquivos que falharem ficam fora do resultado.
+    """
+    digests = {name: file_hash(path) for name, path in paths.items()}
+    pending = [name for name, path in paths.items() if not os.path.isdir(_compiled_dir(path, digests[name]))]
+
+    failed = set()
+    workers = min(len(pending), os.cpu_count() or 1)
+    if workers > 1:
+        # spawn: o processo do Streamlit tem várias threads, fork não é seguro
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {name: pool.submit(compile_lines, paths[name], parser, digests[name]) for name in pending}
+            for name, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Erro ao compilar {paths[name]}: {e}")
+                    failed.add(name)
+
+    results = {}
+    for name, path in paths.items():
+        if name in failed:
+            continue
+        try:
+            results[name] = load_lines_compiled(path, parser, digests[name])
+        except Exception as e:
+            logger.error(f"Erro ao carregar {path}: {e}")
+    return results
+
+def load_lines_compiled(path: str, parser: Callable[[str], Sequence], digest: Optional[str] = None) -> PackedLines:
+    """
+    Linhas do KML a partir da versão compilada (ou compila com `parser`)
+
+    Args:
+        path: Caminho do KML
+        parser: Função que lê o KML e retorna a lista de linhas
+        digest: Hash do arquivo, se já calculado
+    """
+    target = _compiled_dir(path, digest or file_hash(path))
+    if os.path.isdir(target):
+        try:
+            arrays = _read_arrays(target, ("coords", "offsets"))
+            logger.info(f"{path}: linhas carregadas do cache compilado")
+            return PackedLines(arrays["coords"], arrays["offsets"])
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache compilado de {path} inválido, recompilando: {e}")
+
+    packed = PackedLines.from_lines(parser(path))
+    _write_arrays(path, target, {"coords": packed.coords, "offsets": packed.offsets})
+    return packed
+
+def load_ctos_compiled(path: str, parser: Callable[[str], List[dict]]) -> List[dict]:
+    """
+    CTOs do KML a partir da versão compilada (ou compila com `parser`)
+
+    Args:
+        path: Caminho do KML
+        parser: Função que lê o KML e retorna os registros (name, desc, lat, lon, pluscode)
+    """
+    target = _compiled_dir(path, file_hash(path))
+    if os.path.isdir(target):
+        try:
+            columns = _read_arrays(target, CTO_COLUMNS)
+            logger.info(f"{path}: CTOs carregadas do cache compilado")
+            return [
+                dict(zip(CTO_COLUMNS, values))
+                for values in zip(*(columns[name].tolist() for name in CTO_COLUMNS))
+            ]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache compilado de {path} inválido, recompilando: {e}")
+
+    records = parser(path)
+    arrays = {
+        "name": np.array([r["name"] for r in records], dtype=str),
+        "desc": np.array([r["desc"] for r in records], dtype=str),
+        "lat": np.array([r["lat"] for r in records], dtype=np.float64),
+        "lon": np.array([r["lon"] for r in records], dtype=np.float64),
+        "pluscode": np.array([r["pluscode"] for r in records], dtype=str),
+    }
+    _write_arrays(path, target, arrays)
+    return records
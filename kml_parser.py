@@ -0,0 +1,126 @@
+"""
+Leitura incremental de KML (CTOs e linhas de projeto)
+Salve como: kml_parser.py
+
+Usa `lxml.etree.iterparse`: cada Placemark/LineString é entregue assim que
+termina de ser lido e em seguida removido da árvore, então a memória não
+cresce com o tamanho do arquivo. Aceita caminho ou objeto de arquivo (ex.:
+upload do Streamlit ou resposta HTTP em streaming).
+"""
+
+import logging
+from typing import IO, Iterator, List, Optional, Union
+import numpy as np
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+# Qualquer namespace (KML 2.2, earth.google.com, etc.)
+PLACEMARK_TAG = "{*}Placemark"
+LINESTRING_TAG = "{*}LineString"
+
+KMLSource = Union[str, IO[bytes]]
+
+# ======================
+# Funções Auxiliares
+# ======================
+def _release(elem) -> None:
+    """Libera o elemento processado e os irmãos anteriores já lidos"""
+    elem.clear(keep_tail=False)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+def _child_text(elem, path: str) -> Optional[str]:
+    found = elem.find(path)
+    if found is not None and found.text:
+        return found.text.strip()
+    return None
+
+def _decode_slow(tokens: List[str], dims: int) -> np.ndarray:
+    """Caminho tupla a tupla, usado só quando o bloco tem tuplas malformadas"""
+    rows = []
+    for item in tokens:
+        parts = item.split(",")
+        if len(parts) >= 2:
+            try:
+                values = [float(p) for p in parts[:3]]
+            except ValueError:
+                continue
+            rows.append((values + [0.0])[:dims] if dims == 3 else values[:2])
+    return np.array(rows, dtype=np.float64).reshape(-1, dims)
+
+def decode_coordinates(text: str, with_altitude: bool = False) -> np.ndarray:
+    """
+    Bloco <coordinates> ("lon,lat[,alt] ...") para array de uma vez
+
+    Returns:
+        np.ndarray: N x 2 com (lat, lon), ou N x 3 com (lat, lon, alt) se
+        `with_altitude`; vértices fora da faixa válida são descartados.
+    """
+    dims = 3 if with_altitude else 2
+    tokens = text.split()
+    values = ",".join(tokens).split(",")
+    n = len(tokens)
+
+    try:
+        if len(values) == 3 * n:
+            raw = np.array(values, dtype=np.float64).reshape(n, 3)
+        elif len(values) == 2 * n:
+            raw = np.array(values, dtype=np.float64).reshape(n, 2)
+            if with_altitude:
+                raw = np.column_stack([raw, np.zeros(n)])
+        else:
+            raise ValueError("tuplas com número variável de valores")
+    except ValueError:
+        raw = _decode_slow(tokens, dims)
+
+    lon, lat = raw[:, 0], raw[:, 1]
+    valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    coords = raw[valid][:, :dims].copy()
+    coords[:, [0, 1]] = coords[:, [1, 0]]
+    return coords
+
+# ======================
+# Leitores
+# ======================
+def iter_placemarks(source: KMLSource) -> Iterator[dict]:
+    """
+    Percorre os Placemarks do KML
+
+    Yields:
+        dict: name, desc (primeiro <value> do ExtendedData) e coordinates
+        (texto do primeiro <coordinates>); campos ausentes vêm como None
+    """
+    for _, elem in etree.iterparse(source, events=("end",), tag=PLACEMARK_TAG, huge_tree=True):
+        yield {
+            "name": _child_text(elem, "{*}name"),
+            "desc": _child_text(elem, ".//{*}value"),
+            "coordinates": _child_text(elem, ".//{*}coordinates"),
+        }
+        _release(elem)
+
+def iter_linestrings(source: KMLSource) -> Iterator[str]:
+    """Texto de <coordinates> de cada LineString do KML, na ordem do arquivo"""
+    for _, elem in etree.iterparse(source, events=("end",), tag=(LINESTRING_TAG, PLACEMARK_TAG), huge_tree=True):
+        if etree.QName(elem).localname == "LineString":
+            text = _child_text(elem, "{*}coordinates")
+            if text:
+                yield text
+            # O Placemark pai é liberado quando terminar
+            elem.clear(keep_tail=False)
+        else:
+            _release(elem)
+
+def read_lines(source: KMLSource) -> List[np.ndarray]:
+    """Todas as LineStrings do KML com 2+ vértices válidos, como arrays (n x 2) de lat/lon"""
+    lines = []
+    for text in iter_linestrings(source):
+        coords = decode_coordinates(text)
+        if len(coords) > 1:
+            lines.append(coords)
+    return lines
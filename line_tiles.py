@@ -0,0 +1,287 @@
+"""
+Tiles GeoJSON (z/x/y) das linhas de projeto
+Salve como: line_tiles.py
+
+As linhas de cada versão dos KMLs são recortadas uma vez em tiles GeoJSON
+(zooms TILE_MIN_ZOOM a TILE_MAX_ZOOM, usando o nível da pirâmide de
+simplificação de cada zoom) e gravadas em `static/tiles/<versão>/z/x/y.json`.
+O Streamlit serve a pasta `static/` (server.enableStaticServing em
+.streamlit/config.toml) e a camada Leaflet `ProjectTileLayer` busca só os
+tiles visíveis, em vez de receber todas as linhas no HTML do mapa.
+
+A geração roda em segundo plano; até terminar, o mapa usa as linhas em
+volta do cliente (ProjectLines.layers_near).
+"""
+
+import os
+import json
+import math
+import shutil
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import shapely
+from branca.element import MacroElement, Template
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+STATIC_DIR = os.environ.get("STATIC_DIR", "static")
+TILES_DIR = os.path.join(STATIC_DIR, "tiles")
+TILE_URL_PREFIX = os.environ.get("TILE_URL_PREFIX", "/app/static/tiles")
+TILE_MIN_ZOOM = 12
+TILE_MAX_ZOOM = 16  # zooms maiores reutilizam os tiles deste
+COORD_DECIMALS = 6
+DONE_MARKER = ".done"
+
+_build_lock = threading.Lock()
+_building = set()
+
+# ======================
+# Matemática dos Tiles
+# ======================
+def lonlat_to_tile(lon: np.ndarray, lat: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Tile (x, y) Web Mercator que contém cada ponto"""
+    n = 2 ** zoom
+    lat_rad = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    x = np.floor((np.asarray(lon) + 180.0) / 360.0 * n).astype(np.int64)
+    y = np.floor((1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / math.pi) / 2.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1), np.clip(y, 0, n - 1)
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(oeste, sul, leste, norte) do tile em graus"""
+    n = 2 ** zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+def tile_url_template(version: str) -> str:
+    return f"{TILE_URL_PREFIX}/{version}/{{z}}/{{x}}/{{y}}.json"
+
+# ======================
+# Geração
+# ======================
+def _parts(geom) -> List[list]:
+    """Partes (listas de [lon, lat]) de uma LineString/MultiLineString recortada"""
+    if geom.geom_type == "LineString":
+        geoms = [geom]
+    elif geom.geom_type in ("MultiLineString", "GeometryCollection"):
+        geoms = [g for g in geom.geoms if g.geom_type == "LineString"]
+    else:
+        return []
+    return [
+        np.round(shapely.get_coordinates(g), COORD_DECIMALS).tolist()
+        for g in geoms if not g.is_empty and len(g.coords) > 1
+    ]
+
+def _write_zoom(project_lines, zoom: int, target: str) -> int:
+    """Recorta as linhas de um zoom em tiles; retorna quantos tiles foram gravados"""
+    simplified = project_lines.pyramid.lines_for_zoom(zoom)
+    colors = {company: data["color"] for company, data in project_lines.all_lines.items()}
+
+    geoms, owners = [], []
+    for company, packed in simplified.items():
+        if not len(packed):
+            continue
+        line_ids = np.repeat(np.arange(len(packed)), np.diff(packed.offsets))
+        geoms.append(shapely.linestrings(packed.coords[:, ::-1], indices=line_ids))
+        owners.extend([company] * len(packed))
+    if not geoms:
+        return 0
+    geoms = np.concatenate(geoms)
+    owners = np.array(owners, dtype=object)
+
+    # Tiles cobertos pelo retângulo de cada linha
+    bounds = shapely.bounds(geoms)
+    x0, y1 = lonlat_to_tile(bounds[:, 0], bounds[:, 1], zoom)
+    x1, y0 = lonlat_to_tile(bounds[:, 2], bounds[:, 3], zoom)
+    tiles: Dict[Tuple[int, int], List[int]] = {}
+    for i, (ax, bx, ay, by) in enumerate(zip(x0.tolist(), x1.tolist(), y0.tolist(), y1.tolist())):
+        for tx in range(ax, bx + 1):
+            for ty in range(ay, by + 1):
+                tiles.setdefault((tx, ty), []).append(i)
+
+    for (tx, ty), ids in tiles.items():
+        ids = np.asarray(ids, dtype=np.intp)
+        clipped = shapely.clip_by_rect(geoms[ids], *tile_bounds(zoom, tx, ty))
+        by_company: Dict[str, list] = {}
+        for company, geom in zip(owners[ids].tolist(), clipped):
+            if geom is not None and not geom.is_empty:
+                by_company.setdefault(company, []).extend(_parts(geom))
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"empresa": company, "color": colors[company]},
+                "geometry": {"type": "MultiLineString", "coordinates": parts}
+            }
+            for company, parts in by_company.items() if parts
+        ]
+        if not features:
+            continue
+        folder = os.path.join(target, str(zoom), str(tx))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"{ty}.json"), "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, separators=(",", ":"), ensure_ascii=False)
+    return len(tiles)
+
+def build_tiles(project_lines, version: str) -> str:
+    """Gera todos os tiles de uma versão numa pasta temporária e publica de uma vez"""
+    target = os.path.join(TILES_DIR, version)
+    tmp = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    total = 0
+    for zoom in range(TILE_MIN_ZOOM, TILE_MAX_ZOOM + 1):
+        total += _write_zoom(project_lines, zoom, tmp)
+    open(os.path.join(tmp, DONE_MARKER), "w").close()
+
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for entry in os.listdir(TILES_DIR):
+        if entry != version and ".tmp" not in entry:
+            shutil.rmtree(os.path.join(TILES_DIR, entry), ignore_errors=True)
+    logger.info(f"Tiles das linhas de projeto gerados: versão {version}, {total} tiles")
+    return target
+
+def _build_in_background(project_lines, version: str) -> None:
+    try:
+        build_tiles(project_lines, version)
+    except Exception as e:
+        logger.error(f"Erro ao gerar tiles da versão {version}: {e}")
+    finally:
+        with _build_lock:
+            _building.discard(version)
+
+def ensure_tiles(project_lines) -> Optional[str]:
+    """
+    Versão dos tiles pronta para uso, ou None enquanto são gerados
+
+    A primeira chamada para uma versão nova dispara a geração em segundo plano.
+    """
+    version = project_lines.version
+    if os.path.exists(os.path.join(TILES_DIR, version, DONE_MARKER)):
+        return version
+    with _build_lock:
+        if version not in _building:
+            _building.add(version)
+            os.makedirs(TILES_DIR, exist_ok=True)
+            threading.Thread(target=_build_in_background, args=(project_lines, version),
+                             name=f"tiles-{version}", daemon=True).start()
+    return None
+
+# ======================
+# Camada Leaflet
+# ======================
+class ProjectTileLayer(MacroElement):
+    """
+    Camada que busca os tiles GeoJSON visíveis conforme o mapa se move
+
+    Acima de TILE_MAX_ZOOM usa os tiles desse zoom; abaixo de TILE_MIN_ZOOM
+    não desenha nada.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            (function() {
+                var map = {{ this._parent.get_name() }};
+                var group = L.layerGroup().addTo(map);
+                var loaded = {};
+                var band = null;
+                var urlTemplate = {{ this.url_template|tojson }};
+
+                function tileX(lon, n) { return Math.floor((lon + 180) / 360 * n); }
+                function tileY(lat, n) {
+                    var r = lat * Math.PI / 180;
+                    return Math.floor((1 - Math.log(Math.tan(r) + 1 / Math.cos(r)) / Math.PI) / 2 * n);
+                }
+
+                function refresh() {
+                    if (map.getZoom() < {{ this.min_zoom }}) {
+                        group.clearLayers(); loaded = {}; band = null;
+                        return;
+                    }
+                    var z = Math.min({{ this.max_zoom }}, Math.round(map.getZoom()));
+                    if (z !== band) { group.clearLayers(); loaded = {}; band = z; }
+                    var b = map.getBounds();
+                    var n = Math.pow(2, z);
+                    for (var x = tileX(b.getWest(), n); x <= tileX(b.getEast(), n); x++) {
+                        for (var y = tileY(b.getNorth(), n); y <= tileY(b.getSouth(), n); y++) {
+                            var key = z + "/" + x + "/" + y;
+                            if (loaded[key]) { continue; }
+                            loaded[key] = true;
+                            var url = urlTemplate.replace("{z}", z).replace("{x}", x).replace("{y}", y);
+                            (function(tileZoom) {
+                                fetch(url)
+                                    .then(function(r) { if (!r.ok) { throw r.status; } return r.text(); })
+                                    .then(function(text) {
+                                        if (band !== tileZoom) { return; }
+                                        L.geoJSON(JSON.parse(text), {
+                                            style: function(f) {
+                                                return {color: f.properties.color, weight: {{ this.weight }}, opacity: {{ this.opacity }}};
+                                            },
+                                            onEachFeature: function(f, layer) {
+                                                layer.bindTooltip("Projeto " + f.properties.empresa);
+                                            }
+                                        }).addTo(group);
+                                    })
+                                    .catch(function() {});
+                            })(z);
+                        }
+                    }
+                }
+
+                map.on("moveend", refresh);
+                refresh();
+            })();
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, version: str, weight: int = 3, opacity: float = 0.6):
+        super().__init__()
+        self._name = "ProjectTileLayer"
+        self.url_template = tile_url_template(version)
+        self.min_zoom = TILE_MIN_ZOOM
+        self.max_zoom = TILE_MAX_ZOOM
+        self.weight = weight
+        self.opacity = opacity
+
+
+class ProjectLinesLayer(MacroElement):
+    """
+    Camada com uma FeatureCollection já serializada (ProjectLines.layers_near)
+
+    O texto entra direto no script do mapa, sem passar por objetos do folium.
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            L.geoJSON({{ this.payload }}, {
+                style: function(f) {
+                    return {color: f.properties.color, weight: {{ this.weight }}, opacity: {{ this.opacity }}};
+                },
+                onEachFeature: function(f, layer) {
+                    layer.bindTooltip("Projeto " + f.properties.empresa);
+                }
+            }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, payload: str, weight: int = 3, opacity: float = 0.6):
+        super().__init__()
+        self._name = "ProjectLinesLayer"
+        self.payload = payload
+        self.weight = weight
+        self.opacity = opacity
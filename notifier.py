@@ -8,6 +8,7 @@ import requests
 import logging
 import os
 import streamlit as st
+from rate_limiter import PendingResult, get_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +18,7 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = st.secrets["TELEGRAM_BOT_TOKEN"]
 CHAT_ID = st.secrets["TELEGRAM_CHAT_ID"] 
 
-def send_telegram_message(message: str):
-    """Função genérica para enviar mensagem ao Telegram."""
-    if not BOT_TOKEN or not CHAT_ID:
-        logger.warning("⚠️ Bot Telegram não configurado.")
-        return False
+def _post_telegram_message(message: str) -> bool:
     try:
         url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
         payload = {"chat_id": CHAT_ID, "text": message, "parse_mode": "Markdown"}
@@ -31,6 +28,18 @@ def send_telegram_message(message: str):
         logger.error(f"Erro ao enviar mensagem Telegram: {e}")
         return False
 
+def send_telegram_message(message: str) -> PendingResult:
+    """
+    Função genérica para enviar mensagem ao Telegram.
+
+    O envio entra na fila do Telegram (limite de taxa compartilhado) e não
+    bloqueia a página; `.result()` do retorno indica se foi enviado.
+    """
+    if not BOT_TOKEN or not CHAT_ID:
+        logger.warning("⚠️ Bot Telegram não configurado.")
+        return PendingResult.resolved(False)
+    return get_limiter("telegram").submit(_post_telegram_message, message)
+
 
 # =======================================================
 # Notificações específicas do sistema
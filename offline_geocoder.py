@@ -0,0 +1,113 @@
+"""
+Geocodificação reversa offline (ruas e bairros locais)
+Salve como: offline_geocoder.py
+
+Lê um GeoJSON da área atendida com os trechos de rua (LineString/
+MultiLineString com a propriedade "name") e os bairros (Polygon/MultiPolygon
+com "name" e, opcionalmente, "cidade"). Dois STRtree do shapely respondem
+"rua, bairro, cidade" para uma coordenada em bem menos de 1 ms, sem rede.
+"""
+
+import os
+import json
+import math
+import logging
+from typing import List, Optional
+import numpy as np
+import shapely
+from shapely.geometry import Point, shape
+from shapely.ops import transform
+from geo_index import local_earth_radius
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+GEOCODER_DATA_PATH = os.environ.get("GEOCODER_DATA_PATH", "enderecos.geojson")
+DEFAULT_CITY = "Criciúma"
+reference_lat = -28.6775
+
+# Distância máxima (m) até a rua mais próxima para aceitar o resultado
+MAX_STREET_DISTANCE = 60.0
+
+# ======================
+# Geocodificador
+# ======================
+class OfflineGeocoder:
+    """
+    Índices de ruas e bairros projetados em metros (equiretangular)
+
+    Args:
+        features: Features do GeoJSON (ruas e bairros)
+    """
+
+    def __init__(self, features: List[dict]):
+        self._radius = local_earth_radius(reference_lat)
+        self._cos_ref = math.cos(math.radians(reference_lat))
+
+        streets, street_names = [], []
+        areas, area_names, area_cities = [], [], []
+        for feature in features:
+            props = feature.get("properties") or {}
+            name = (props.get("name") or "").strip()
+            geometry = feature.get("geometry")
+            if not name or not geometry:
+                continue
+            try:
+                geom = transform(self._project, shape(geometry))
+            except Exception as e:
+                logger.warning(f"Feature inválida ignorada ({name}): {e}")
+                continue
+            if geom.geom_type in ("LineString", "MultiLineString"):
+                streets.append(geom)
+                street_names.append(name)
+            elif geom.geom_type in ("Polygon", "MultiPolygon"):
+                areas.append(geom)
+                area_names.append(name)
+                area_cities.append((props.get("cidade") or props.get("city") or DEFAULT_CITY).strip())
+
+        self._streets = np.array(streets, dtype=object)
+        self._street_names = street_names
+        self._street_tree = shapely.STRtree(self._streets)
+        self._areas = np.array(areas, dtype=object)
+        self._area_names = area_names
+        self._area_cities = area_cities
+        self._area_tree = shapely.STRtree(self._areas)
+        logger.info(f"Geocodificador offline: {len(streets)} ruas, {len(areas)} bairros")
+
+    def __len__(self) -> int:
+        return len(self._streets)
+
+    def _project(self, lons, lats, z=None):
+        x = self._radius * np.radians(lons) * self._cos_ref
+        y = self._radius * np.radians(lats)
+        return x, y
+
+    def reverse(self, lat: float, lon: float) -> Optional[str]:
+        """"rua, bairro, cidade" do ponto, ou None se não houver rua próxima"""
+        if not len(self):
+            return None
+        x, y = self._project(lon, lat)
+        point = Point(float(x), float(y))
+
+        ids = self._street_tree.query_nearest(point, max_distance=MAX_STREET_DISTANCE)
+        if len(ids) == 0:
+            return None
+        parts = [self._street_names[int(ids[0])]]
+
+        city = DEFAULT_CITY
+        inside = self._area_tree.query(point, predicate="within")
+        if len(inside):
+            area = int(inside.min())
+            parts.append(self._area_names[area])
+            city = self._area_cities[area]
+        parts.append(city)
+        return ", ".join(parts)
+
+
+def load_offline_geocoder(path: str = GEOCODER_DATA_PATH) -> OfflineGeocoder:
+    """Lê o GeoJSON de ruas e bairros e monta os índices"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return OfflineGeocoder(data.get("features", []))
@@ -6,9 +6,9 @@ Salve como: pages/analise_rede.py
 import streamlit as st
 from login_system import require_authentication
 import pandas as pd
-from xml.etree import ElementTree as ET
 import io
 from openlocationcode import openlocationcode as olc
+from kml_parser import iter_placemarks, decode_coordinates
 import logging
 
 logger = logging.getLogger(__name__)
@@ -51,29 +51,15 @@ def processar_kml(uploaded_file):
         return {}
     
     try:
-        content = uploaded_file.read()
-        root = ET.fromstring(content)
-        ns = {'kml': 'http://www.opengis.net/kml/2.2'}
-        
+        uploaded_file.seek(0)
         ctos_localizacao = {}
         
-        for placemark in root.findall('.//kml:Placemark', ns):
-            nome_elem = placemark.find('kml:name', ns)
-            coords_elem = placemark.find('.//kml:coordinates', ns)
-            
-            if nome_elem is not None and coords_elem is not None:
-                nome_cto = nome_elem.text.strip()
-                coords_text = coords_elem.text.strip()
-                
-                coords = coords_text.split(',')
-                if len(coords) >= 2:
-                    try:
-                        lon = float(coords[0])
-                        lat = float(coords[1])
-                        pluscode = coords_to_pluscode(lat, lon)
-                        ctos_localizacao[nome_cto] = pluscode
-                    except ValueError:
-                        continue
+        for placemark in iter_placemarks(uploaded_file):
+            if placemark["name"] and placemark["coordinates"]:
+                coords = decode_coordinates(placemark["coordinates"])
+                if len(coords):
+                    lat, lon = coords[0].tolist()
+                    ctos_localizacao[placemark["name"]] = coords_to_pluscode(lat, lon)
         
         return ctos_localizacao
         
@@ -6,119 +6,23 @@ Salve como: pages/auditoria_functions/condominio_handler.py
 
 import streamlit as st
 import logging
-from typing import List, Tuple
-from openlocationcode import openlocationcode as olc
-from geopy.distance import geodesic
-import gdown
-import requests
-import xml.etree.ElementTree as ET
+from geocoding import pluscode_to_coords_or_none
+from project_lines import format_line_proximity
+from precompute import get_precomputed
 from pages.auditoria_functions.map_viewer import show_project_map
 
 logger = logging.getLogger(__name__)
 
-# Configurações
-reference_lat = -28.6775
-reference_lon = -49.3696
-file_id_ctos = "1EcKNk2yqHDEMMXJZ17fT0flPV19HDhKJ"
-ctos_kml_path = "ctos.kml"
-
 # ======================
 # Funções Auxiliares
 # ======================
 
-def validate_coordinates(lat: float, lon: float) -> bool:
-    return -90 <= lat <= 90 and -180 <= lon <= 180
-
 def format_distance(distance_m: float) -> str:
     if distance_m < 1000:
         return f"{distance_m:.1f}m"
     else:
         return f"{distance_m/1000:.2f}km"
 
-def coords_to_pluscode(lat, lon):
-    return olc.encode(lat, lon)
-
-@st.cache_data(ttl=3600)
-def download_ctos_file(file_id: str, output: str) -> str:
-    try:
-        url = f"https://drive.google.com/uc?id={file_id}"
-        gdown.download(url, output, quiet=True, fuzzy=True)
-        return output
-    except Exception as e:
-        logger.error(f"Erro ao baixar CTOs: {e}")
-        raise
-
-@st.cache_data(ttl=3600)
-def load_ctos_from_kml(path: str) -> List[dict]:
-    try:
-        namespaces = {'kml': 'http://www.opengis.net/kml/2.2'}
-        tree = ET.parse(path)
-        root = tree.getroot()
-        ctos = []
-        for placemark in root.findall(".//kml:Placemark", namespaces):
-            name_elem = placemark.find("kml:name", namespaces)
-            coords_elem = placemark.find(".//kml:coordinates", namespaces)
-            if coords_elem is not None and coords_elem.text:
-                parts = coords_elem.text.strip().split(",")
-                if len(parts) >= 2:
-                    lon, lat = float(parts[0]), float(parts[1])
-                    if validate_coordinates(lat, lon):
-                        ctos.append({
-                            "name": name_elem.text.strip() if name_elem is not None else "CTO",
-                            "lat": lat,
-                            "lon": lon
-                        })
-        return ctos
-    except Exception as e:
-        logger.error(f"Erro ao carregar CTOs: {e}")
-        return []
-
-def pluscode_to_coords(pluscode: str) -> Tuple[float, float]:
-    try:
-        pluscode = pluscode.strip().upper()
-        if not olc.isFull(pluscode):
-            pluscode = olc.recoverNearest(pluscode, reference_lat, reference_lon)
-        decoded = olc.decode(pluscode)
-        lat = (decoded.latitudeLo + decoded.latitudeHi) / 2
-        lon = (decoded.longitudeLo + decoded.longitudeHi) / 2
-        return lat, lon
-    except Exception as e:
-        logger.error(f"Erro ao converter Plus Code: {e}")
-        return None, None
-
-def find_nearest_ctos(lat: float, lon: float, ctos: List[dict], max_radius: float = 400.0) -> List[dict]:
-    if not ctos:
-        return []
-    dists = []
-    for cto in ctos:
-        if cto["name"].upper().startswith("CDOI"):
-            continue
-        dist = geodesic((lat, lon), (cto["lat"], cto["lon"])).meters
-        if dist <= max_radius:
-            dists.append({**cto, "distance": dist})
-    dists.sort(key=lambda x: x["distance"])
-    return dists
-
-@st.cache_data(ttl=3600)
-def get_walking_route(start_lat: float, start_lon: float, end_lat: float, end_lon: float):
-    try:
-        url = f"http://router.project-osrm.org/route/v1/foot/{start_lon},{start_lat};{end_lon},{end_lat}"
-        params = {"overview": "full", "geometries": "geojson", "steps": "false"}
-        response = requests.get(url, params=params, timeout=15)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("code") == "Ok" and data.get("routes"):
-                route = data["routes"][0]
-                return {
-                    "distance": route["distance"],
-                    "duration": route["duration"],
-                    "geometry": route["geometry"]
-                }
-        return None
-    except Exception as e:
-        logger.error(f"Erro ao calcular rota: {e}")
-        return None
-
 # ======================
 # Função Principal
 # ======================
@@ -167,6 +71,7 @@ def show_condominio_form(row: dict):
                     help="Clicou errado ou não tem porta? Busque outra CTO"
                 ):
                     st.session_state[f'mostrar_busca_cond_{row["id"]}'] = True
+                    st.session_state[f'recalcular_cond_{row["id"]}'] = True
                     st.rerun()
 
         # ========================================
@@ -190,61 +95,42 @@ def show_condominio_form(row: dict):
         if st.session_state.get(f'mostrar_busca_cond_{row["id"]}', False):
             try:
                 # Converter Plus Code para coordenadas
-                lat, lon = pluscode_to_coords(row['plus_code_cliente'])
+                lat, lon = pluscode_to_coords_or_none(row['plus_code_cliente'])
 
                 if lat and lon:
-                    # Carregar CTOs
-                    with st.spinner("Carregando dados..."):
-                        download_ctos_file(file_id_ctos, ctos_kml_path)
-                        ctos = load_ctos_from_kml(ctos_kml_path)
-
-                    # Buscar CTOs próximas
-                    candidate_ctos = find_nearest_ctos(lat, lon, ctos, max_radius=3500.0)
-
-                    if candidate_ctos:
-                        cto_routes = []
-
-                        with st.spinner("📍 Calculando rotas..."):
-                            for cto in candidate_ctos[:10]:
-                                route = get_walking_route(lat, lon, cto["lat"], cto["lon"])
-
-                                if route:
-                                    linha_reta = geodesic((lat, lon), (cto["lat"], cto["lon"])).meters
-                                    if route["distance"] > linha_reta * 5:
-                                        route["distance"] = linha_reta
-
-                                    cto_routes.append({
-                                        "cto": cto,
-                                        "route": route,
-                                        "distance": route["distance"]
-                                    })
-                                else:
-                                    cto_routes.append({
-                                        "cto": cto,
-                                        "route": None,
-                                        "distance": cto["distance"]
-                                    })
-
-                            cto_routes.sort(key=lambda x: x["distance"])
-                            cto_routes = cto_routes[:5]
+                    # CTOs, rotas e redes próximas (pré-calculadas ao criar a solicitação)
+                    with st.spinner("📍 Calculando rotas..."):
+                        precalculado = get_precomputed(
+                            row['id'], row['plus_code_cliente'],
+                            refresh=st.session_state.pop(f'recalcular_cond_{row["id"]}', False)
+                        )
+                    cto_routes = precalculado["cto_routes"]
 
+                    if cto_routes:
+                        if precalculado['endereco']:
+                            st.caption(f"📫 {precalculado['endereco']}")
                         st.success(f"✅ {len(cto_routes)} CTOs encontradas")
 
                         # MAPA
+                        # CTO inspecionada (padrão: a mais próxima); só ela tem a rota completa buscada
+                        idx_rota = min(st.session_state.get(f'rota_cto_cond_{row["id"]}', 0), len(cto_routes) - 1)
                         show_project_map(
                             pluscode=row['plus_code_cliente'],
                             client_name=row.get('predio_ftta', 'Condomínio'),
                             unique_key=f"cond_busca_{row['id']}",
-                            show_ctos=True
+                            show_ctos=True,
+                            route_to=cto_routes[idx_rota]["cto"]
                         )
 
                         st.markdown("---")
 
+                        st.caption(f"📐 Rede de projeto mais próxima: {format_line_proximity(precalculado['linhas'])}")
+
                         # Exibir CTOs
                         for idx, item in enumerate(cto_routes):
                             cto = item["cto"]
                             route = item["route"]
-                            pluscode_cto = coords_to_pluscode(cto["lat"], cto["lon"])
+                            pluscode_cto = cto["pluscode"]
 
                             icons = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣"]
                             icon = icons[idx] if idx < len(icons) else "📍"
@@ -297,6 +183,13 @@ def show_condominio_form(row: dict):
                                         st.success(f"✅ CTO {cto['name']} escolhida!")
                                         del st.session_state[f'mostrar_busca_cond_{row["id"]}']
                                         st.rerun()
+                                if idx != idx_rota and st.button(
+                                    "🗺️ Ver rota",
+                                    key=f"ver_rota_cond_{row['id']}_{idx}",
+                                    width='stretch'
+                                ):
+                                    st.session_state[f'rota_cto_cond_{row["id"]}'] = idx
+                                    st.rerun()
 
                             st.markdown("---")
                     else:
@@ -9,157 +9,36 @@ import streamlit as st
 import folium
 from streamlit_folium import st_folium
 import logging
-from typing import List, Tuple
 from openlocationcode import openlocationcode as olc
-import xml.etree.ElementTree as ET
-import gdown
+from cto_catalog import get_cto_catalog
+from project_lines import get_project_lines
+from line_tiles import ensure_tiles, ProjectTileLayer, ProjectLinesLayer
+from routing import get_walking_route
+from geocoding import pluscode_to_coords_or_none
 
 logger = logging.getLogger(__name__)
 
 # ======================
 # Configurações
 # ======================
-reference_lat = -28.6775
-reference_lon = -49.3696
-
-KML_CONFIGS = {
-    "COOPER-COCAL": {
-        "file_id": "1XD-GgwgFgB2RcKkBAxf5RSBWu2yfIf2w",
-        "color": "#FF1493",
-        "path": "cooper_cocal.kml"
-    },
-    "COOPERA": {
-        "file_id": "1E5tKI5brZMo1rcrJANXggYegV1IrCdnv",
-        "color": "#00FF00",
-        "path": "coopera.kml"
-    },
-    "COPERALIANCA": {
-        "file_id": "1cDZwFpCDygrmZvP2_oSZoXT3oKXKT8Bh",
-        "color": "#0000FF",
-        "path": "coperalianca.kml"
-    },
-    "CERMOFUL": {
-        "file_id": "1r4gnRFaNUmAZ6f9oTdR1x9RcfksWTXDx",
-        "color": "#FF8C00",
-        "path": "cermoful.kml"
-    },
-    "CERTREL": {
-        "file_id": "1ZGczns-MIV897jQ8HRhH6LFgMRMdydm4",
-        "color": "#8A2BE2",
-        "path": "certrel.kml"
-    },
-    "FORÇALUZ": {
-        "file_id": "1CHAWKnha0C1f44uLJYXUOj0UcrtnlPKK",
-        "color": "#FFD700",
-        "path": "forcaluz.kml"
-    },
-    "CELESC": {
-        "file_id": "1M5P4_THpr1qxcxhPVOyQCdGTE5_7faRB",
-        "color": "#FF0000",
-        "path": "celesc.kml"
-    }
-}
+MAP_ZOOM = 16
+MAP_LINES_RADIUS_M = 800.0       # raio inicial das linhas de projeto em volta do cliente
+MAP_LINES_MAX_RADIUS_M = 12800.0  # limite do botão "Carregar mais linhas"
 
 # ======================
 # Funções Auxiliares
 # ======================
 
-def validate_coordinates(lat: float, lon: float) -> bool:
-    """Valida se as coordenadas estão dentro dos limites válidos"""
-    return -90 <= lat <= 90 and -180 <= lon <= 180
-
 def coords_to_pluscode(lat: float, lon: float) -> str:
     """Converte coordenadas para Plus Code"""
     return olc.encode(lat, lon)
 
-def pluscode_to_coords(pluscode: str) -> Tuple[float, float]:
-    """Converte Plus Code para coordenadas"""
-    try:
-        pluscode = pluscode.strip().upper()
-        if not olc.isFull(pluscode):
-            pluscode = olc.recoverNearest(pluscode, reference_lat, reference_lon)
-        decoded = olc.decode(pluscode)
-        lat = (decoded.latitudeLo + decoded.latitudeHi) / 2
-        lon = (decoded.longitudeLo + decoded.longitudeHi) / 2
-        return lat, lon
-    except Exception as e:
-        logger.error(f"Erro ao converter Plus Code: {e}")
-        return None, None
-
-@st.cache_data(ttl=1800)  # Cache de 30 minutos
-def download_file(file_id: str, output: str) -> str:
-    """Download de arquivo do Google Drive"""
-    try:
-        url = f"https://drive.google.com/uc?id={file_id}"
-        gdown.download(url, output, quiet=True)
-        logger.info(f"Arquivo {output} baixado com sucesso")
-        return output
-    except Exception as e:
-        logger.error(f"Erro ao baixar {output}: {e}")
-        raise Exception(f"Falha no download do arquivo {output}: {str(e)}")
-
-@st.cache_data(ttl=1800)  # Cache de 30 minutos
-def load_lines_from_kml(path: str) -> List[List[Tuple[float, float]]]:
-    """Carrega linhas de projeto de um arquivo KML"""
-    try:
-        namespaces = {'kml': 'http://www.opengis.net/kml/2.2'}
-        tree = ET.parse(path)
-        root = tree.getroot()
-        lines = []
-        for ls in root.findall(".//kml:LineString", namespaces):
-            coords_elem = ls.find("kml:coordinates", namespaces)
-            if coords_elem is not None and coords_elem.text:
-                try:
-                    raw = coords_elem.text.strip().split()
-                    coords = []
-                    for c in raw:
-                        parts = c.split(',')
-                        if len(parts) >= 2:
-                            lon, lat = float(parts[0]), float(parts[1])
-                            if validate_coordinates(lat, lon):
-                                coords.append((lat, lon))
-                    if len(coords) > 1:
-                        lines.append(coords)
-                except (ValueError, IndexError) as e:
-                    logger.warning(f"Linha KML inválida ignorada: {e}")
-                    continue
-        logger.info(f"Carregadas {len(lines)} linhas do KML {path}")
-        return lines
-    except Exception as e:
-        logger.error(f"Erro ao carregar linhas KML: {e}")
-        return []
-
-@st.cache_data(ttl=1800)  # Cache de 30 minutos
-def load_ctos_from_kml(path: str) -> List[dict]:
-    """Carrega CTOs de um arquivo KML"""
-    try:
-        namespaces = {'kml': 'http://www.opengis.net/kml/2.2'}
-        tree = ET.parse(path)
-        root = tree.getroot()
-        ctos = []
-        for placemark in root.findall(".//kml:Placemark", namespaces):
-            name_elem = placemark.find("kml:name", namespaces)
-            coords_elem = placemark.find(".//kml:coordinates", namespaces)
-            if coords_elem is not None and coords_elem.text:
-                parts = coords_elem.text.strip().split(",")
-                if len(parts) >= 2:
-                    lon, lat = float(parts[0]), float(parts[1])
-                    if validate_coordinates(lat, lon):
-                        ctos.append({
-                            "name": name_elem.text.strip() if name_elem is not None else "CTO",
-                            "lat": lat,
-                            "lon": lon
-                        })
-        return ctos
-    except Exception as e:
-        logger.error(f"Erro ao carregar CTOs: {e}")
-        return []
-
 # ======================
 # Função Principal
 # ======================
 
-def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: str = None, show_ctos: bool = False):
+def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: str = None, show_ctos: bool = False,
+                     route_to: dict = None):
     """
     Exibe mapa interativo com projetos e localização do cliente
     
@@ -168,6 +47,7 @@ def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: st
         client_name: Nome do cliente (para exibição)
         unique_key: Chave única para o mapa (obrigatório)
         show_ctos: Se True, mostra CTOs no mapa (padrão: False)
+        route_to: CTO inspecionada; desenha a rota a pé até ela (única rota completa pedida ao OSRM)
     
     Returns:
         bool: True se exibiu com sucesso, False se houve erro
@@ -179,47 +59,31 @@ def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: st
     
     try:
         # Converter Plus Code para coordenadas
-        lat, lon = pluscode_to_coords(pluscode)
+        lat, lon = pluscode_to_coords_or_none(pluscode)
         
         if lat is None or lon is None:
             st.error("❌ Erro ao converter Plus Code para coordenadas")
             return False
 
-        # Carregar linhas de projeto com progresso
+        # Linhas de projeto (compartilhadas entre as sessões): com os tiles
+        # desta versão prontos, o navegador busca só os tiles visíveis; até
+        # lá, vão no mapa as linhas no raio em volta do cliente, já
+        # simplificadas para o zoom inicial e serializadas (GeoJSON em cache)
+        raio_key = f"raio_linhas_{unique_key}"
+        raio_linhas = st.session_state.get(raio_key, MAP_LINES_RADIUS_M)
         all_lines = {}
-        progress_bar = st.progress(0, text="🗺️ Carregando projetos de rede...")
-        total_companies = len(KML_CONFIGS)
-
-        for idx, (company, config) in enumerate(KML_CONFIGS.items()):
-            try:
-                progress_bar.progress(
-                    (idx + 1) / total_companies,
-                    text=f"🗺️ Carregando {company}... ({idx + 1}/{total_companies})"
-                )
-                download_file(config["file_id"], config["path"])
-                lines = load_lines_from_kml(config["path"])
-                all_lines[company] = {
-                    "lines": lines,
-                    "color": config["color"]
-                }
-                logger.info(f"Carregadas {len(lines)} linhas para {company}")
-            except Exception as e:
-                logger.error(f"Erro ao carregar {company}: {e}")
-                all_lines[company] = {"lines": [], "color": config["color"]}
-
-        progress_bar.empty()  # Remove a barra de progresso
+        with st.spinner("🗺️ Carregando projetos de rede..."):
+            project_lines = get_project_lines()
+            tiles_version = ensure_tiles(project_lines)
+            if tiles_version is None:
+                all_lines = project_lines.layers_near(lat, lon, raio_linhas, MAP_ZOOM)
 
         # Carregar CTOs se solicitado
-        ctos = []
+        cto_catalog = None
         if show_ctos:
             try:
                 st.caption("🔍 Carregando CTOs...")
-                file_id_ctos = "1EcKNk2yqHDEMMXJZ17fT0flPV19HDhKJ"
-                ctos_path = "ctos.kml"
-                download_file(file_id_ctos, ctos_path)
-                ctos = load_ctos_from_kml(ctos_path)
-                # Filtrar CDOIs
-                ctos = [c for c in ctos if not c["name"].upper().startswith("CDOI")]
+                cto_catalog = get_cto_catalog()
             except Exception as e:
                 logger.error(f"Erro ao carregar CTOs: {e}")
 
@@ -228,20 +92,16 @@ def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: st
         # Criar mapa centrado no cliente
         mapa = folium.Map(
             location=[lat, lon],
-            zoom_start=16,
+            zoom_start=MAP_ZOOM,
             tiles="OpenStreetMap"
         )
         
         # Adicionar linhas de projeto
-        for company, data in all_lines.items():
-            for line_coords in data["lines"]:
-                folium.PolyLine(
-                    locations=line_coords,
-                    color=data["color"],
-                    weight=3,
-                    opacity=0.6,
-                    tooltip=f"Projeto {company}"
-                ).add_to(mapa)
+        if tiles_version:
+            ProjectTileLayer(tiles_version).add_to(mapa)
+        for data in all_lines.values():
+            if data["count"]:
+                ProjectLinesLayer(data["payload"]).add_to(mapa)
         
         # Marcador do CLIENTE
         folium.Marker(
@@ -251,20 +111,23 @@ def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: st
             icon=folium.Icon(color='red', icon='home', prefix='fa')
         ).add_to(mapa)
         
+        # Rota a pé até a CTO inspecionada
+        if route_to:
+            route = get_walking_route(lat, lon, route_to["lat"], route_to["lon"])
+            if route and route.get("geometry"):
+                folium.PolyLine(
+                    locations=[(c[1], c[0]) for c in route["geometry"]["coordinates"]],
+                    color="#222222",
+                    weight=4,
+                    opacity=0.8,
+                    dash_array="6",
+                    tooltip=f"🚶 Rota até {route_to['name']} - {route['distance']:.0f}m"
+                ).add_to(mapa)
+        
         # Adicionar CTOs se solicitado
-        if show_ctos and ctos:
-            from geopy.distance import geodesic
-            
-            # Filtrar CTOs próximas (raio de 500m)
-            ctos_proximas = []
-            for cto in ctos:
-                dist = geodesic((lat, lon), (cto["lat"], cto["lon"])).meters
-                if dist <= 500:
-                    ctos_proximas.append({**cto, "distance": dist})
-            
-            # Ordenar por distância e pegar as 10 mais próximas
-            ctos_proximas.sort(key=lambda x: x["distance"])
-            ctos_proximas = ctos_proximas[:10]
+        if show_ctos and cto_catalog:
+            # 10 CTOs mais próximas dentro de 500m (já ordenadas por distância)
+            ctos_proximas = cto_catalog.nearest(lat, lon, k=10, max_radius=500)
             
             # Adicionar marcadores
             cores = ['green', 'blue', 'orange', 'purple', 'darkred', 'lightblue', 'pink', 'gray', 'lightgreen', 'cadetblue']
@@ -275,7 +138,7 @@ def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: st
                 <div style='width: 200px'>
                     <h4>{cto['name']}</h4>
                     <p>📏 {cto['distance']:.0f}m</p>
-                    <p>📍 {coords_to_pluscode(cto['lat'], cto['lon'])}</p>
+                    <p>📍 {cto['pluscode']}</p>
                 </div>
                 """
                 
@@ -296,7 +159,26 @@ def show_project_map(pluscode: str, client_name: str = "Cliente", unique_key: st
             feature_group_to_add=None
         )
         
-        st.caption("🗺️ Mapa interativo com projetos de rede")
+        if tiles_version:
+            st.caption("🗺️ Mapa interativo com projetos de rede · linhas carregadas conforme a área visível")
+            return True
+
+        total_linhas = sum(data["total"] for data in all_lines.values())
+        exibidas = sum(data["count"] for data in all_lines.values())
+        col_legenda, col_mais = st.columns([3, 1])
+        with col_legenda:
+            st.caption(
+                f"🗺️ Mapa interativo com projetos de rede · {exibidas} de {total_linhas} linhas "
+                f"num raio de {raio_linhas / 1000:.1f}km"
+            )
+        with col_mais:
+            if raio_linhas < MAP_LINES_MAX_RADIUS_M and exibidas < total_linhas and st.button(
+                "➕ Carregar mais linhas",
+                key=f"mais_linhas_{unique_key}",
+                width='stretch'
+            ):
+                st.session_state[raio_key] = min(raio_linhas * 2, MAP_LINES_MAX_RADIUS_M)
+                st.rerun()
         
         return True
         
@@ -8,7 +8,8 @@ from login_system import require_authentication
 from openlocationcode import openlocationcode as olc
 import re
 import pandas as pd
-from viability_functions import create_viability_request, validate_plus_code
+from viability_functions import create_viability_request
+from geocoding import validate_plus_code, pluscode_to_coords_or_none
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,11 +29,8 @@ if not require_authentication():
     st.stop()
 
 # ======================
-# Configurações
+# Funções Auxiliares
 # ======================
-reference_lat = -28.6775
-reference_lon = -49.3696
-
 def validate_coordinates(coord_string: str) -> tuple:
     """
     Valida e extrai coordenadas no formato: lat, lon
@@ -63,20 +61,6 @@ def coords_to_pluscode(lat: float, lon: float) -> str:
     """Converte coordenadas para Plus Code"""
     return olc.encode(lat, lon)
 
-def pluscode_to_coords(pluscode: str) -> tuple:
-    """Converte Plus Code para coordenadas"""
-    try:
-        pluscode = pluscode.strip().upper()
-        if not olc.isFull(pluscode):
-            pluscode = olc.recoverNearest(pluscode, reference_lat, reference_lon)
-        decoded = olc.decode(pluscode)
-        lat = (decoded.latitudeLo + decoded.latitudeHi) / 2
-        lon = (decoded.longitudeLo + decoded.longitudeHi) / 2
-        return (lat, lon)
-    except Exception as e:
-        logger.error(f"Erro ao converter Plus Code: {e}")
-        return (None, None)
-
 # ======================
 # Funcoes de Busca de Predios (Inteligente)
 # ======================
@@ -289,7 +273,7 @@ if input_method == "Plus Code":
             st.success("✅ Plus Code válido!")
             
             # Converter para coordenadas para exibir
-            lat, lon = pluscode_to_coords(location_input)
+            lat, lon = pluscode_to_coords_or_none(location_input)
             if lat is not None and lon is not None:
                 st.caption(f"📍 Coordenadas: {lat:.6f}, {lon:.6f}")
                 
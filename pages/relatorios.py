@@ -20,9 +20,19 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import folium
-from folium.plugins import MarkerCluster
+from folium.plugins import MarkerCluster, HeatMap
 from streamlit_folium import st_folium
-from openlocationcode import openlocationcode as olc
+from report_maps import (
+    approved_feature_collection,
+    GeoJsonMarkerCluster,
+    APPROVED_POINT_TO_LAYER,
+    get_demand_grid,
+    demand_feature_collection,
+    demand_heat_points,
+    DEMAND_CELL_SIZES_M,
+    DEMAND_DEFAULT_CELL_M
+)
+from geocoding import pluscode_to_coords_or_none
 from datetime import datetime, timedelta
 import logging
 import re
@@ -42,25 +52,6 @@ st.set_page_config(
 if not require_authentication():
     st.stop()
 
-# ======================
-# Funções Auxiliares
-# ======================
-def pluscode_to_coords(pluscode: str):
-    """Converte Plus Code para coordenadas"""
-    try:
-        reference_lat = -28.6775
-        reference_lon = -49.3696
-        pluscode = pluscode.strip().upper()
-        if not olc.isFull(pluscode):
-            pluscode = olc.recoverNearest(pluscode, reference_lat, reference_lon)
-        decoded = olc.decode(pluscode)
-        lat = (decoded.latitudeLo + decoded.latitudeHi) / 2
-        lon = (decoded.longitudeLo + decoded.longitudeHi) / 2
-        return lat, lon
-    except Exception as e:
-        logger.error(f"Erro ao converter Plus Code: {e}")
-        return None, None
-
 # ======================
 # Header
 # ======================
@@ -252,7 +243,7 @@ if ftth_rejeitadas:
     
     # Adicionar marcadores
     for idx, row in enumerate(ftth_rejeitadas):
-        lat, lon = pluscode_to_coords(row['plus_code_cliente'])
+        lat, lon = pluscode_to_coords_or_none(row['plus_code_cliente'])
 
         if lat is not None and lon is not None:
             popup_html = f"""
@@ -305,83 +296,19 @@ if ftth_aprovadas_mapa:
         tiles="OpenStreetMap"
     )
 
-    # Criar cluster de marcadores
-    marker_cluster_aprovadas = MarkerCluster(
+    # Pontos numa única FeatureCollection; agrupamento, ícones e popups
+    # são montados no navegador
+    geojson_aprovadas, contagem_tipos = approved_feature_collection(ftth_aprovadas_mapa)
+    GeoJsonMarkerCluster(
+        geojson_aprovadas,
+        APPROVED_POINT_TO_LAYER,
         name="Viabilidades Aprovadas",
         overlay=True,
-        control=True,
-        icon_create_function=None
+        control=True
     ).add_to(mapa_aprovadas)
-
-    # Contadores por tipo
-    count_ftth = 0
-    count_predio = 0
-    count_condominio = 0
-
-    # Adicionar marcadores
-    for idx, row in enumerate(ftth_aprovadas_mapa):
-        lat, lon = pluscode_to_coords(row['plus_code_cliente'])
-
-        if lat is not None and lon is not None:
-            tipo = row.get('tipo_instalacao', 'FTTH')
-
-            # Definir cor e ícone baseado no tipo
-            if tipo == 'FTTH':
-                cor = 'green'
-                icone = 'home'
-                tipo_label = '🏠 FTTH'
-                count_ftth += 1
-            elif tipo == 'Condomínio':
-                cor = 'orange'
-                icone = 'building'
-                tipo_label = '🏘️ Condomínio'
-                count_condominio += 1
-            else:
-                cor = 'blue'
-                icone = 'building'
-                tipo_label = '🏢 Prédio'
-                count_predio += 1
-
-            # Construir popup com informações relevantes
-            popup_html = f"""
-            <div style='width: 280px'>
-                <h4>✅ {tipo_label}</h4>
-                <p><b>📍 Plus Code:</b> {row['plus_code_cliente']}</p>
-                <p><b>👤 Cliente:</b> {row.get('nome_cliente', 'N/A')}</p>
-                <p><b>👥 Solicitante:</b> {row['usuario']}</p>
-                <p><b>📅 Data:</b> {format_time_br_supa(row.get('data_auditoria', ''))}</p>
-            """
-
-            # Adicionar campos específicos por tipo
-            if tipo == 'FTTH' or tipo == 'Condomínio':
-                popup_html += f"""
-                <hr style='margin: 5px 0'>
-                <p><b>📦 CTO:</b> {row.get('cto_numero', 'N/A')}</p>
-                <p><b>📏 Distância:</b> {row.get('distancia_cliente', 'N/A')}</p>
-                <p><b>🔌 Portas:</b> {row.get('portas_disponiveis', 'N/A')}</p>
-                <p><b>📶 Menor RX:</b> {row.get('menor_rx', 'N/A')} dBm</p>
-                """
-            else:  # Prédio
-                popup_html += f"""
-                <hr style='margin: 5px 0'>
-                <p><b>🏢 Prédio:</b> {row.get('predio_ftta', 'N/A')}</p>
-                <p><b>📡 CDOI:</b> {row.get('cdoi', 'N/A')}</p>
-                <p><b>🔌 Portas:</b> {row.get('portas_disponiveis', 'N/A')}</p>
-                <p><b>📶 Média RX:</b> {row.get('media_rx', 'N/A')} dBm</p>
-                """
-
-            popup_html += f"""
-                <hr style='margin: 5px 0'>
-                <p><b>🔍 Auditor:</b> {row.get('auditado_por', 'N/A')}</p>
-            </div>
-            """
-
-            folium.Marker(
-                location=[lat, lon],
-                popup=folium.Popup(popup_html, max_width=320),
-                tooltip=f"✅ {row['plus_code_cliente']} - {row.get('nome_cliente', 'Cliente')}",
-                icon=folium.Icon(color=cor, icon=icone, prefix='fa')
-            ).add_to(marker_cluster_aprovadas)
+    count_ftth = contagem_tipos["FTTH"]
+    count_condominio = contagem_tipos["Condomínio"]
+    count_predio = contagem_tipos["Prédio"]
 
     # Renderizar mapa
     st_folium(
@@ -409,6 +336,79 @@ else:
 
 st.markdown("---")
 
+# ======================
+# 3.2 MAPA - Demanda por Região
+# ======================
+st.subheader("🔥 Mapa de Demanda por Região")
+st.info("📍 Pedidos agregados numa grade: veja onde se concentram as aprovações e as rejeições no período")
+
+col_demanda1, col_demanda2 = st.columns(2)
+with col_demanda1:
+    tamanho_celula = st.selectbox(
+        "Tamanho da célula",
+        options=DEMAND_CELL_SIZES_M,
+        index=DEMAND_CELL_SIZES_M.index(DEMAND_DEFAULT_CELL_M),
+        format_func=lambda m: f"{m} m",
+        key="celula_demanda"
+    )
+with col_demanda2:
+    metricas_demanda = {"Total de pedidos": "total", "Aprovadas": "aprovadas", "Sem viabilidade": "rejeitadas"}
+    metrica_label = st.radio("Contagem", list(metricas_demanda.keys()), horizontal=True, key="metrica_demanda")
+    metrica = metricas_demanda[metrica_label]
+
+grade_demanda = get_demand_grid(data_inicio_iso, data_fim_iso, float(tamanho_celula))
+
+if grade_demanda[metrica].sum() > 0:
+    mapa_demanda = folium.Map(
+        location=[-28.6775, -49.3696],
+        zoom_start=12,
+        tiles="OpenStreetMap"
+    )
+
+    # Grade colorida pela faixa de contagem de cada célula
+    folium.GeoJson(
+        demand_feature_collection(grade_demanda, metrica),
+        name="Grade de demanda",
+        style_function=lambda feature: {
+            "fillColor": feature["properties"]["cor"],
+            "color": feature["properties"]["cor"],
+            "weight": 1,
+            "fillOpacity": 0.6
+        },
+        tooltip=folium.GeoJsonTooltip(
+            fields=["total", "aprovadas", "rejeitadas"],
+            aliases=["📊 Pedidos:", "✅ Aprovadas:", "❌ Sem viabilidade:"]
+        )
+    ).add_to(mapa_demanda)
+
+    # Mapa de calor com o centro de cada célula pesado pela contagem
+    HeatMap(
+        demand_heat_points(grade_demanda, metrica),
+        name="Mapa de calor",
+        radius=20,
+        show=False
+    ).add_to(mapa_demanda)
+
+    folium.LayerControl(collapsed=False).add_to(mapa_demanda)
+
+    st_folium(
+        mapa_demanda,
+        width=None,
+        height=500,
+        returned_objects=[],
+        key="mapa_demanda"
+    )
+
+    celulas_ocupadas = int((grade_demanda[metrica] > 0).sum())
+    st.caption(
+        f"📊 {int(grade_demanda[metrica].sum())} pedidos em {celulas_ocupadas} células de {tamanho_celula} m · "
+        f"🟡 menor → 🔴 maior concentração"
+    )
+else:
+    st.info("📭 Não há pedidos para o mapa de demanda no período selecionado")
+
+st.markdown("---")
+
 # ======================
 # 4. TABELAS FTTH
 # ======================
@@ -0,0 +1,213 @@
+"""
+Pré-cálculo das CTOs candidatas ao criar uma solicitação
+Salve como: precompute.py
+
+Quando uma solicitação FTTH/Condomínio é criada, o id entra numa fila local e
+um worker em segundo plano calcula o endereço, as CTOs candidatas ordenadas
+pela distância a pé e a proximidade das redes de projeto. O resultado fica
+numa tabela SQLite ao lado do cache de rotas, então a auditoria abre a busca
+sem esperar OSRM nem LocationIQ.
+
+Solicitações sem resultado (criadas antes, ou com o worker ainda ocupado) são
+calculadas na hora pelo mesmo caminho e gravadas para as próximas aberturas.
+
+Cada resultado guarda a versão do catálogo de CTOs usada; com um KML novo ele
+deixa de valer e é recalculado. Resultados em que alguma CTO ficou só com a
+distância em linha reta (OSRM fora do ar ou circuito aberto) valem por pouco
+tempo, para a rota real ser buscada de novo.
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional
+from disk_cache import CACHE_DIR
+from cto_catalog import get_cto_catalog
+from project_lines import get_project_lines
+from routing import rank_ctos_by_route
+from geocoding import lookup_address, pluscode_to_coords, GEOCODE_WAIT
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+PRECOMPUTE_TYPES = ("FTTH", "Condomínio")
+PRECOMPUTE_WORKERS = 2
+CANDIDATE_RADIUS = 3500.0  # mesmo raio usado na busca manual
+PRECOMPUTE_TTL = 7 * 24 * 3600     # segundos; resultado completo
+PRECOMPUTE_FALLBACK_TTL = 300      # segundos; alguma CTO sem rota (linha reta)
+PRECOMPUTE_MAX_ENTRIES = 20000
+EVICTION_FRACTION = 0.1            # fração extra removida ao passar do limite
+
+# ======================
+# Armazenamento
+# ======================
+class PrecomputeStore:
+    """
+    Tabela local {id da solicitação: resultado em JSON}
+
+    Args:
+        name: Nome do arquivo SQLite em CACHE_DIR
+        max_entries: Limite de linhas; as calculadas há mais tempo saem primeiro
+    """
+
+    COLUMNS = ("request_id", "plus_code", "catalog_version", "data", "computed_at", "expires_at")
+
+    def __init__(self, name: str = "precomputed", max_entries: int = PRECOMPUTE_MAX_ENTRIES):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite")
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = tuple(row[1] for row in self._conn.execute("PRAGMA table_info(precomputed)"))
+        if columns and columns != self.COLUMNS:
+            # Formato antigo (sem versão/validade): só um cache, recalculado sob demanda
+            self._conn.execute("DROP TABLE precomputed")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS precomputed ("
+            "request_id TEXT PRIMARY KEY, plus_code TEXT NOT NULL, catalog_version TEXT NOT NULL, "
+            "data TEXT NOT NULL, computed_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_precomputed_computed_at ON precomputed (computed_at)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM precomputed").fetchone()[0]
+
+    def get(self, request_id: str, plus_code: str, catalog_version: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT plus_code, catalog_version, data, expires_at FROM precomputed WHERE request_id = ?",
+                (str(request_id),)
+            ).fetchone()
+        # Plus Code editado, KML de CTOs novo ou validade vencida invalidam o resultado
+        if row is None or row[0] != plus_code or row[1] != catalog_version or row[3] <= time.time():
+            return None
+        return json.loads(row[2])
+
+    def put(self, request_id: str, plus_code: str, catalog_version: str, data: Dict, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO precomputed "
+                "(request_id, plus_code, catalog_version, data, computed_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(request_id), plus_code, catalog_version, json.dumps(data), now, now + ttl)
+            )
+            self._conn.commit()
+            # Contagem aproximada (substituições também contam); _evict recalcula
+            if cursor.rowcount:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove os vencidos e, se ainda passar do limite, os mais antigos (chamada com o lock)"""
+        self._conn.execute("DELETE FROM precomputed WHERE expires_at <= ?", (time.time(),))
+        self._count = self._conn.execute("SELECT COUNT(*) FROM precomputed").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess > 0:
+            n = excess + int(self.max_entries * EVICTION_FRACTION)
+            self._conn.execute(
+                "DELETE FROM precomputed WHERE request_id IN "
+                "(SELECT request_id FROM precomputed ORDER BY computed_at LIMIT ?)", (n,)
+            )
+            self._count = self._conn.execute("SELECT COUNT(*) FROM precomputed").fetchone()[0]
+        self._conn.commit()
+        logger.info(f"Pré-cálculos: {self._count} resultados mantidos após a limpeza")
+
+
+store = PrecomputeStore()
+
+# ======================
+# Cálculo
+# ======================
+def compute_request(request_id: str, plus_code: str, wait: Optional[float] = None) -> Dict:
+    """
+    Calcula e grava os dados da busca de CTOs de uma solicitação
+
+    Args:
+        wait: Espera máxima (s) pelo endereço na fila da LocationIQ; None
+            espera a vez (workers). Sem resposta, o endereço fica None e é
+            preenchido numa leitura seguinte.
+
+    Returns:
+        dict: lat, lon, endereco (None se a LocationIQ falhou), cto_routes
+        (itens {"cto", "route", "distance"} de `rank_ctos_by_route`, sem
+        geometria) e linhas (lista [empresa, distância] das redes de projeto
+        próximas).
+    """
+    lat, lon = pluscode_to_coords(plus_code)
+    catalog = get_cto_catalog()
+    candidates = catalog.find_nearest(lat, lon, CANDIDATE_RADIUS)
+    cto_routes = rank_ctos_by_route(lat, lon, candidates) if candidates else []
+    for item in cto_routes:
+        if item["route"]:
+            item["route"] = {"distance": item["route"]["distance"], "duration": item["route"]["duration"]}
+
+    data = {
+        "lat": lat,
+        "lon": lon,
+        "endereco": lookup_address(lat, lon, wait=wait),
+        "cto_routes": cto_routes,
+        "linhas": get_project_lines().index.nearest_sorted(lat, lon)
+    }
+    fallback = any(item["route"] is None for item in cto_routes)
+    store.put(request_id, plus_code, catalog.version, data,
+              PRECOMPUTE_FALLBACK_TTL if fallback else PRECOMPUTE_TTL)
+    return data
+
+def get_precomputed(request_id: str, plus_code: str, compute: bool = True,
+                    refresh: bool = False) -> Optional[Dict]:
+    """
+    Resultado pré-calculado da solicitação
+
+    Args:
+        compute: Calcula na hora se faltar (ou estiver velho)
+        refresh: Ignora o resultado gravado e calcula de novo
+    """
+    if not refresh:
+        data = store.get(request_id, plus_code, get_cto_catalog().version)
+        if data is not None:
+            if data["endereco"] is None:
+                # Consulta deixada na fila no cálculo: já no cache ou ainda pendente (sem esperar)
+                data["endereco"] = lookup_address(data["lat"], data["lon"], wait=0)
+            return data
+        if not compute:
+            return None
+    # Na thread da página: espera curta pelo endereço
+    return compute_request(request_id, plus_code, wait=GEOCODE_WAIT)
+
+# ======================
+# Fila e Workers
+# ======================
+_jobs: "queue.Queue[tuple]" = queue.Queue()
+_workers_lock = threading.Lock()
+_workers = []
+
+def _worker() -> None:
+    while True:
+        request_id, plus_code = _jobs.get()
+        try:
+            if store.get(request_id, plus_code, get_cto_catalog().version) is None:
+                compute_request(request_id, plus_code)
+                logger.info(f"Pré-cálculo concluído para a solicitação {request_id}")
+        except Exception as e:
+            logger.error(f"Erro no pré-cálculo da solicitação {request_id}: {e}")
+        finally:
+            _jobs.task_done()
+
+def _ensure_workers() -> None:
+    with _workers_lock:
+        while len(_workers) < PRECOMPUTE_WORKERS:
+            thread = threading.Thread(target=_worker, name=f"precompute-{len(_workers)}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+def enqueue_precompute(request_id: str, plus_code: str) -> None:
+    """Agenda o pré-cálculo de uma solicitação recém-criada (não bloqueia)"""
+    _ensure_workers()
+    _jobs.put((str(request_id), plus_code))
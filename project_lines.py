@@ -0,0 +1,410 @@
+"""
+Linhas de projeto das concessionárias (postes) e proximidade do cliente
+Salve como: project_lines.py
+
+Os KMLs de todas as empresas são carregados uma vez por processo. Um STRtree
+do shapely sobre todas as linhas responde "qual a distância do cliente até a
+rede de projeto mais próxima de cada empresa" em milissegundos.
+"""
+
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import shapely
+from shapely.geometry import Point
+import streamlit as st
+from geo_index import local_earth_radius
+from kml_parser import read_lines
+from kml_cache import PackedLines, load_many_lines_compiled
+from asset_sync import sync_assets
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+reference_lat = -28.6775
+reference_lon = -49.3696
+PROJECT_LINES_TTL = 3600  # segundos
+
+# Distância máxima considerada na busca por linhas próximas
+DEFAULT_MAX_DISTANCE_M = 1000.0
+
+# Tolerâncias (m) da pirâmide de simplificação, da mais fina à mais grossa
+SIMPLIFY_TOLERANCES_M = (0.25, 1.0, 4.0, 16.0, 64.0)
+
+# Casas decimais das coordenadas nas camadas GeoJSON (~10 cm)
+LAYER_COORD_DECIMALS = 6
+
+# Configuração dos arquivos KML com suas respectivas cores e IDs
+KML_CONFIGS = {
+    "COOPER-COCAL": {
+        "file_id": "1XD-GgwgFgB2RcKkBAxf5RSBWu2yfIf2w",
+        "color": "#FF1493",
+        "path": "cooper_cocal.kml"
+    },
+    "COOPERA": {
+        "file_id": "1E5tKI5brZMo1rcrJANXggYegV1IrCdnv",
+        "color": "#00FF00",
+        "path": "coopera.kml"
+    },
+    "COPERALIANCA": {
+        "file_id": "1cDZwFpCDygrmZvP2_oSZoXT3oKXKT8Bh",
+        "color": "#0000FF",
+        "path": "coperalianca.kml"
+    },
+    "CERMOFUL": {
+        "file_id": "1r4gnRFaNUmAZ6f9oTdR1x9RcfksWTXDx",
+        "color": "#FF8C00",
+        "path": "cermoful.kml"
+    },
+    "CERTREL": {
+        "file_id": "1ZGczns-MIV897jQ8HRhH6LFgMRMdydm4",
+        "color": "#8A2BE2",
+        "path": "certrel.kml"
+    },
+    "FORÇALUZ": {
+        "file_id": "1CHAWKnha0C1f44uLJYXUOj0UcrtnlPKK",
+        "color": "#FFD700",
+        "path": "forcaluz.kml"
+    },
+    "CELESC": {
+        "file_id": "1M5P4_THpr1qxcxhPVOyQCdGTE5_7faRB",
+        "color": "#FF0000",
+        "path": "celesc.kml"
+    }
+}
+
+# ======================
+# Download e Leitura
+# ======================
+def load_lines_from_kml(path: str) -> List[np.ndarray]:
+    try:
+        lines = read_lines(path)
+        logger.info(f"Carregadas {len(lines)} linhas do KML {path}")
+        return lines
+    except Exception as e:
+        logger.error(f"Erro ao carregar KML: {e}")
+        raise Exception(f"Falha ao carregar arquivo KML: {str(e)}")
+
+def load_all_project_lines() -> Dict[str, dict]:
+    """
+    Baixa e lê os KMLs de todas as empresas ({empresa: {lines, color, count}})
+
+    "lines" é um PackedLines (cada linha um array n x 2 de lat/lon); KMLs que
+    não mudaram vêm do cache compilado, sem reler o XML. "version" é a versão
+    do KML no manifesto de sincronização (vazia se a empresa falhou).
+    """
+    # Downloads em paralelo; arquivos sem mudança não são substituídos
+    synced = sync_assets({company: (config["file_id"], config["path"]) for company, config in KML_CONFIGS.items()})
+
+    # KMLs novos são compilados em paralelo (um processo por arquivo)
+    compiled = load_many_lines_compiled({company: KML_CONFIGS[company]["path"] for company in synced}, read_lines)
+
+    all_lines = {}
+    for company, config in KML_CONFIGS.items():
+        try:
+            if company not in synced:
+                raise Exception(f"Falha no download do arquivo {config['path']}")
+            if company not in compiled:
+                raise Exception(f"Falha ao carregar arquivo KML {config['path']}")
+            lines = compiled[company]
+            all_lines[company] = {
+                "lines": lines, "color": config["color"], "count": len(lines),
+                "version": synced[company]["sha256"][:16]
+            }
+            logger.info(f"Carregadas {len(lines)} linhas para {company}")
+        except Exception as e:
+            logger.error(f"Erro ao carregar {company}: {e}")
+            all_lines[company] = {"lines": PackedLines.from_lines([]), "color": config["color"], "count": 0, "version": ""}
+    return all_lines
+
+# ======================
+# Índice de Proximidade
+# ======================
+class ProjectLineIndex:
+    """
+    STRtree sobre as linhas de todas as empresas
+
+    As linhas são projetadas em metros (equiretangular em torno de
+    `reference_lat`); na área atendida a distorção fica abaixo de 1%.
+    """
+
+    def __init__(self, all_lines: Dict[str, dict]):
+        self.companies = list(all_lines.keys())
+        self.colors = {company: data["color"] for company, data in all_lines.items()}
+        self._radius = local_earth_radius(reference_lat)
+        self._cos_ref = math.cos(math.radians(reference_lat))
+
+        geoms = []
+        owners = []
+        for code, company in enumerate(self.companies):
+            packed = all_lines[company]["lines"]
+            if not len(packed):
+                continue
+            # Todas as linhas da empresa de uma vez a partir dos arrays compactados
+            x, y = self._project(packed.coords[:, 0], packed.coords[:, 1])
+            line_ids = np.repeat(np.arange(len(packed)), np.diff(packed.offsets))
+            geoms.append(shapely.linestrings(np.column_stack([x, y]), indices=line_ids))
+            owners.append(np.full(len(packed), code, dtype=np.intp))
+
+        self._geoms = np.concatenate(geoms) if geoms else np.empty(0, dtype=object)
+        self._owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.intp)
+        # Posição da primeira linha de cada empresa no índice
+        counts = np.bincount(self._owners, minlength=len(self.companies))
+        self._starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.intp)
+        self._tree = shapely.STRtree(self._geoms)
+        logger.info(f"Índice de linhas de projeto: {len(self._geoms)} linhas de {len(self.companies)} empresas")
+
+    def __len__(self) -> int:
+        return len(self._geoms)
+
+    def _project(self, lats, lons):
+        x = self._radius * np.radians(lons) * self._cos_ref
+        y = self._radius * np.radians(lats)
+        return x, y
+
+    def _unproject(self, x, y):
+        lats = np.degrees(y / self._radius)
+        lons = np.degrees(x / (self._radius * self._cos_ref))
+        return lats, lons
+
+    def nearest_by_company(self, lat: float, lon: float,
+                           max_distance: float = DEFAULT_MAX_DISTANCE_M) -> Dict[str, Optional[float]]:
+        """
+        Distância (m) do ponto até a linha mais próxima de cada empresa
+
+        Empresas sem linha dentro de `max_distance` ficam com None.
+        """
+        result: Dict[str, Optional[float]] = {company: None for company in self.companies}
+        if not len(self):
+            return result
+
+        x, y = self._project(lat, lon)
+        point = Point(float(x), float(y))
+        ids = self._tree.query(point, predicate="dwithin", distance=max_distance)
+        if len(ids) == 0:
+            return result
+
+        dists = shapely.distance(self._geoms[ids], point)
+        best = np.full(len(self.companies), np.inf)
+        np.minimum.at(best, self._owners[ids], dists)
+        for code, dist in enumerate(best.tolist()):
+            if dist <= max_distance:
+                result[self.companies[code]] = dist
+        return result
+
+    def lines_within(self, lat: float, lon: float, radius: float) -> Dict[str, np.ndarray]:
+        """Índices (dentro de cada empresa) das linhas a até `radius` metros do ponto"""
+        result = {company: np.empty(0, dtype=np.intp) for company in self.companies}
+        if not len(self):
+            return result
+        x, y = self._project(lat, lon)
+        ids = np.sort(self._tree.query(Point(float(x), float(y)), predicate="dwithin", distance=radius))
+        owners = self._owners[ids]
+        for code, company in enumerate(self.companies):
+            mine = ids[owners == code]
+            result[company] = mine - self._starts[code]
+        return result
+
+    def nearest_sorted(self, lat: float, lon: float,
+                       max_distance: float = DEFAULT_MAX_DISTANCE_M) -> List[Tuple[str, float]]:
+        """Lista (empresa, distância) das empresas com rede no raio, da mais próxima à mais distante"""
+        found = [(c, d) for c, d in self.nearest_by_company(lat, lon, max_distance).items() if d is not None]
+        return sorted(found, key=lambda item: item[1])
+
+# ======================
+# Pirâmide de Simplificação
+# ======================
+def meters_per_pixel(zoom: float, lat: float = reference_lat) -> float:
+    """Resolução do mapa (Web Mercator, tiles de 256px) no zoom e latitude dados"""
+    return 156543.03392 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+class SimplificationPyramid:
+    """
+    Linhas simplificadas (Douglas–Peucker) em algumas tolerâncias fixas
+
+    Cada nível guarda, por empresa, um PackedLines com as linhas simplificadas
+    com tolerância de SIMPLIFY_TOLERANCES_M[nivel] metros. O mapa usa o nível
+    mais grosso cuja tolerância não passa de meio pixel no zoom dele.
+    """
+
+    def __init__(self, index: ProjectLineIndex):
+        self.companies = index.companies
+        self.tolerances = SIMPLIFY_TOLERANCES_M
+        self.levels: List[Dict[str, PackedLines]] = []
+
+        for tolerance in self.tolerances:
+            simplified = shapely.simplify(index._geoms, tolerance, preserve_topology=False)
+            coords, line_ids = shapely.get_coordinates(simplified, return_index=True)
+            lats, lons = index._unproject(coords[:, 0], coords[:, 1])
+            sizes = np.bincount(line_ids, minlength=len(simplified))
+
+            level = {}
+            for code, company in enumerate(self.companies):
+                keep = np.flatnonzero(index._owners == code)
+                if not len(keep):
+                    level[company] = PackedLines.from_lines([])
+                    continue
+                # As linhas de cada empresa são contíguas no índice
+                start = int(sizes[:keep[0]].sum())
+                company_sizes = sizes[keep]
+                end = start + int(company_sizes.sum())
+                offsets = np.concatenate([[0], np.cumsum(company_sizes)]).astype(np.int64)
+                level[company] = PackedLines(np.column_stack([lats[start:end], lons[start:end]]), offsets)
+            self.levels.append(level)
+
+        vertices = [sum(level[c].n_points for c in self.companies) for level in self.levels]
+        logger.info(f"Pirâmide de simplificação: vértices por nível {vertices}")
+
+    def level_for_zoom(self, zoom: float, lat: float = reference_lat) -> int:
+        """Nível mais grosso com tolerância de no máximo meio pixel"""
+        max_error = meters_per_pixel(zoom, lat) / 2
+        level = 0
+        for i, tolerance in enumerate(self.tolerances):
+            if tolerance <= max_error:
+                level = i
+        return level
+
+    def lines_for_zoom(self, zoom: float, lat: float = reference_lat) -> Dict[str, PackedLines]:
+        return self.levels[self.level_for_zoom(zoom, lat)]
+
+# ======================
+# Cache Compartilhado
+# ======================
+class ProjectLines:
+    """
+    Linhas de uma carga dos KMLs, o índice de proximidade e a pirâmide de simplificação
+
+    Também guarda, por empresa e nível da pirâmide, as coordenadas de cada
+    linha já serializadas em JSON. Como o objeto vive enquanto a versão dos
+    KMLs não muda, os reruns montam as camadas do mapa juntando strings
+    prontas, sem criar um objeto por linha.
+    """
+
+    def __init__(self, all_lines: Dict[str, dict]):
+        self.all_lines = all_lines
+        self.index = ProjectLineIndex(all_lines)
+        self.pyramid = SimplificationPyramid(self.index)
+        self.loaded_at = time.time()
+        self.version = self._compute_version()
+        self._layer_lock = threading.Lock()
+        self._line_json: Dict[Tuple[str, int], List[str]] = {}
+
+    def _compute_version(self) -> str:
+        """Identifica o conteúdo desta carga (versões dos KMLs, cores e tolerâncias)"""
+        digest = hashlib.sha256(repr(SIMPLIFY_TOLERANCES_M).encode())
+        for company, data in sorted(self.all_lines.items()):
+            digest.update(f"{company}|{data['color']}|{data.get('version', '')}|{data['count']}\n".encode())
+        return digest.hexdigest()[:16]
+
+    def _serialized_lines(self, company: str, level: int) -> List[str]:
+        """Coordenadas ([lon, lat], 6 casas) de cada linha da empresa em JSON, calculadas uma vez"""
+        key = (company, level)
+        cached = self._line_json.get(key)
+        if cached is None:
+            packed = self.pyramid.levels[level][company]
+            cached = [
+                json.dumps(np.round(line[:, ::-1], LAYER_COORD_DECIMALS).tolist(), separators=(",", ":"))
+                for line in packed
+            ]
+            with self._layer_lock:
+                cached = self._line_json.setdefault(key, cached)
+        return cached
+
+    def layers_near(self, lat: float, lon: float, radius: float, zoom: float) -> Dict[str, dict]:
+        """
+        Camadas GeoJSON prontas das linhas a até `radius` metros do ponto
+
+        Returns:
+            dict: {empresa: {payload, color, count, total}}, onde "payload" é
+            uma FeatureCollection serializada com uma MultiLineString e as
+            propriedades "empresa" e "color"
+        """
+        level = self.pyramid.level_for_zoom(zoom, lat)
+        selected = self.index.lines_within(lat, lon, radius)
+        layers = {}
+        for company, data in self.all_lines.items():
+            serialized = self._serialized_lines(company, level)
+            properties = json.dumps({"empresa": company, "color": data["color"]}, ensure_ascii=False)
+            coordinates = ",".join(serialized[i] for i in selected[company].tolist())
+            layers[company] = {
+                "payload": (
+                    '{"type":"FeatureCollection","features":[{"type":"Feature","properties":' + properties
+                    + ',"geometry":{"type":"MultiLineString","coordinates":[' + coordinates + ']}}]}'
+                ),
+                "color": data["color"],
+                "count": len(selected[company]),
+                "total": data["count"]
+            }
+        return layers
+
+
+class _ProjectLinesHolder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Uma carga dos KMLs por vez; quem chega durante a renovação segue com a atual
+        self.build_lock = threading.Lock()
+        self.project_lines: Optional[ProjectLines] = None
+
+
+@st.cache_resource
+def _get_holder() -> _ProjectLinesHolder:
+    return _ProjectLinesHolder()
+
+def refresh_project_lines() -> Optional[ProjectLines]:
+    """
+    Recarrega os KMLs e troca as linhas/índice de uma vez
+
+    Returns:
+        ProjectLines: As novas linhas, ou None se a recarga falhou (as
+        atuais são mantidas)
+    """
+    holder = _get_holder()
+    try:
+        project_lines = ProjectLines(load_all_project_lines())
+    except Exception as e:
+        logger.error(f"Erro ao recarregar linhas de projeto, mantendo versão atual: {e}")
+        return None
+    with holder.lock:
+        holder.project_lines = project_lines
+    return project_lines
+
+def get_project_lines() -> ProjectLines:
+    """Retorna as linhas de projeto do processo, carregando ou renovando após o TTL"""
+    holder = _get_holder()
+    project_lines = holder.project_lines
+    if project_lines is not None and time.time() - project_lines.loaded_at < PROJECT_LINES_TTL:
+        return project_lines
+
+    # Linhas vencidas: outra sessão já está renovando, segue com as atuais
+    if not holder.build_lock.acquire(blocking=project_lines is None):
+        return project_lines
+    try:
+        project_lines = holder.project_lines
+        if project_lines is not None and time.time() - project_lines.loaded_at < PROJECT_LINES_TTL:
+            return project_lines
+        try:
+            new_lines = ProjectLines(load_all_project_lines())
+        except Exception as e:
+            if project_lines is None:
+                raise
+            logger.error(f"Erro ao renovar linhas de projeto, mantendo versão anterior: {e}")
+            project_lines.loaded_at = time.time()
+            return project_lines
+        with holder.lock:
+            holder.project_lines = new_lines
+        return new_lines
+    finally:
+        holder.build_lock.release()
+
+def format_line_proximity(nearest: List[Tuple[str, float]], limit: int = 3) -> str:
+    """Texto curto para exibir ao lado das CTOs candidatas"""
+    if not nearest:
+        return f"Nenhuma rede de projeto em {DEFAULT_MAX_DISTANCE_M:.0f}m"
+    return " · ".join(f"{company}: {dist:.0f}m" for company, dist in nearest[:limit])
@@ -0,0 +1,180 @@
+"""
+Limite de requisições compartilhado pelo processo para as APIs externas
+Salve como: rate_limiter.py
+
+Cada provedor (LocationIQ, OSRM, Telegram) tem um token bucket e uma fila
+próprios, compartilhados por todas as sessões do Streamlit. As chamadas
+enfileiradas com `submit` rodam em threads do limitador e devolvem na hora um
+`PendingResult`, que a página consulta sem dormir dentro da execução do
+script. Chamadas iguais já na fila (mesma `key`) reaproveitam o mesmo resultado.
+
+Os limites podem ser ajustados por variável de ambiente, ex.:
+RATE_LIMIT_LOCATIONIQ=2 (requisições por segundo).
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+# provedor: (requisições por segundo, rajada máxima, threads de execução)
+PROVIDER_LIMITS: Dict[str, Tuple[float, int, int]] = {
+    "locationiq": (2.0, 2, 2),
+    "osrm": (10.0, 10, 0),
+    "telegram": (1.0, 1, 1),
+}
+
+# ======================
+# Token Bucket
+# ======================
+class TokenBucket:
+    """Balde com `capacity` fichas repostas a `rate` por segundo"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Consome uma ficha; retorna 0 se conseguiu ou quantos segundos faltam"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def available(self) -> float:
+        """Fichas disponíveis agora (sem consumir)"""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Espera uma ficha por até `timeout` s (só fora da thread da página)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+def on_page_thread() -> bool:
+    """True na thread que executa o script do Streamlit, onde não se deve esperar fichas"""
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+# ======================
+# Resultado Pendente
+# ======================
+class PendingResult:
+    """Resultado de uma chamada enfileirada; consulte com `done()`/`result()`"""
+
+    def __init__(self, future: Future):
+        self._future = future
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = 0, default: Any = None) -> Any:
+        """
+        Valor da chamada, esperando no máximo `timeout` s (0 = não espera)
+
+        Retorna `default` se ainda estiver na fila ou se a chamada falhou.
+        """
+        try:
+            return self._future.result(timeout=timeout)
+        except Exception:
+            return default
+
+    @classmethod
+    def resolved(cls, value: Any) -> "PendingResult":
+        future = Future()
+        future.set_result(value)
+        return cls(future)
+
+# ======================
+# Limitador por Provedor
+# ======================
+class RateLimiter:
+    """Fila + token bucket de um provedor"""
+
+    def __init__(self, name: str, rate: float, capacity: int, workers: int = 1):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity)
+        self._jobs: "queue.Queue[tuple]" = queue.Queue()
+        self._inflight: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._run, name=f"ratelimit-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._workers:
+            thread.start()
+
+    def _run(self) -> None:
+        while True:
+            key, future, fn, args, kwargs = self._jobs.get()
+            self.bucket.acquire()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                logger.error(f"Erro na chamada enfileirada ({self.name}): {e}")
+                future.set_exception(e)
+            finally:
+                if key is not None:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+                self._jobs.task_done()
+
+    def submit(self, fn: Callable, *args, key: Any = None, **kwargs) -> PendingResult:
+        """Enfileira `fn(*args, **kwargs)` e retorna na hora um PendingResult"""
+        if not self._workers:
+            raise RuntimeError(f"Limitador {self.name} não executa chamadas enfileiradas")
+        with self._lock:
+            if key is not None and key in self._inflight:
+                return PendingResult(self._inflight[key])
+            future = Future()
+            if key is not None:
+                self._inflight[key] = future
+        self._jobs.put((key, future, fn, args, kwargs))
+        return PendingResult(future)
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Ficha para uma chamada feita na própria thread (ex.: pool de rotas)"""
+        return self.bucket.acquire(timeout)
+
+    def pending(self) -> int:
+        return self._jobs.qsize()
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider: str) -> RateLimiter:
+    """Limitador do provedor, criado no primeiro uso e compartilhado pelo processo"""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rate, capacity, workers = PROVIDER_LIMITS[provider]
+            rate = float(os.environ.get(f"RATE_LIMIT_{provider.upper()}", rate))
+            limiter = RateLimiter(provider, rate, max(capacity, 1), workers)
+            _limiters[provider] = limiter
+        return limiter
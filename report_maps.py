@@ -0,0 +1,291 @@
+"""
+Mapas da página de relatórios
+Salve como: report_maps.py
+
+O mapa de viabilidades aprovadas recebe todos os pontos numa única
+FeatureCollection GeoJSON; o agrupamento (Leaflet.markercluster), os ícones e
+os popups são montados no navegador por funções JavaScript. No servidor
+sobra só decodificar o Plus Code e copiar alguns campos de cada linha.
+
+O mapa de demanda agrega aprovadas e rejeitadas numa grade fixa (células de
+DEMAND_CELL_SIZES_M metros) com NumPy; o navegador recebe uma célula por
+área com pedidos, não um marcador por pedido. A grade fica em cache por
+período.
+"""
+
+import json
+import math
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import streamlit as st
+from branca.element import Template
+from folium.plugins import MarkerCluster
+from folium.utilities import camelize
+from geocoding import pluscode_to_coords_or_none
+from viability_functions import format_time_br_supa, get_all_approved, get_ftth_rejected
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+reference_lat = -28.6775
+reference_lon = -49.3696
+
+# Tipo de instalação -> cor e ícone (Font Awesome) do marcador
+APPROVED_STYLES = {
+    "FTTH": {"color": "green", "icon": "home", "label": "🏠 FTTH"},
+    "Condomínio": {"color": "orange", "icon": "building", "label": "🏘️ Condomínio"},
+    "Prédio": {"color": "blue", "icon": "building", "label": "🏢 Prédio"},
+}
+
+# Grade de demanda
+DEMAND_CELL_SIZES_M = (100, 250, 500, 1000)
+DEMAND_DEFAULT_CELL_M = 250
+DEMAND_CACHE_TTL = 600  # segundos
+METERS_PER_DEGREE = 111320.0
+# Escala (amarelo -> vermelho) das células, por faixa de contagem
+DEMAND_COLORS = ("#ffffb2", "#fecc5c", "#fd8d3c", "#f03b20", "#bd0026")
+
+# Monta o marcador de cada feature; o popup só é gerado ao abrir
+APPROVED_POINT_TO_LAYER = """
+function (feature, latlng) {
+    var styles = %(styles)s;
+    var p = feature.properties;
+    var style = styles[p.tipo];
+    function esc(value) {
+        if (value === null || value === undefined || value === "") { return "N/A"; }
+        return String(value).replace(/[&<>"']/g, function(c) {
+            return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+        });
+    }
+    var marker = L.marker(latlng, {
+        icon: L.AwesomeMarkers.icon({icon: style.icon, markerColor: style.color, prefix: "fa"})
+    });
+    marker.bindTooltip("✅ " + esc(p.plus_code) + " - " + (p.cliente ? esc(p.cliente) : "Cliente"));
+    marker.bindPopup(function() {
+        var html = "<div style='width: 280px'>"
+            + "<h4>✅ " + style.label + "</h4>"
+            + "<p><b>📍 Plus Code:</b> " + esc(p.plus_code) + "</p>"
+            + "<p><b>👤 Cliente:</b> " + esc(p.cliente) + "</p>"
+            + "<p><b>👥 Solicitante:</b> " + esc(p.usuario) + "</p>"
+            + "<p><b>📅 Data:</b> " + esc(p.data) + "</p>"
+            + "<hr style='margin: 5px 0'>";
+        if (p.tipo === "Prédio") {
+            html += "<p><b>🏢 Prédio:</b> " + esc(p.predio) + "</p>"
+                + "<p><b>📡 CDOI:</b> " + esc(p.cdoi) + "</p>"
+                + "<p><b>🔌 Portas:</b> " + esc(p.portas) + "</p>"
+                + "<p><b>📶 Média RX:</b> " + esc(p.rx) + " dBm</p>";
+        } else {
+            html += "<p><b>📦 CTO:</b> " + esc(p.cto) + "</p>"
+                + "<p><b>📏 Distância:</b> " + esc(p.distancia) + "</p>"
+                + "<p><b>🔌 Portas:</b> " + esc(p.portas) + "</p>"
+                + "<p><b>📶 Menor RX:</b> " + esc(p.rx) + " dBm</p>";
+        }
+        return html + "<hr style='margin: 5px 0'>"
+            + "<p><b>🔍 Auditor:</b> " + esc(p.auditor) + "</p></div>";
+    }, {maxWidth: 320});
+    return marker;
+}
+""" % {"styles": json.dumps(APPROVED_STYLES, ensure_ascii=False)}
+
+# ======================
+# Funções Auxiliares
+# ======================
+def embed_json(text: str) -> str:
+    """
+    JSON pronto para entrar literalmente num <script>
+
+    Um "</script>" ou "<!--" vindo de campos digitados (nome do cliente,
+    prédio...) encerraria o bloco do script; "<\\/" e "<\\!" continuam
+    valendo o mesmo dentro das strings JavaScript.
+    """
+    return text.replace("</", "<\\/").replace("<!--", "<\\!--")
+
+def approved_tipo(row: dict) -> str:
+    """Tipo de instalação normalizado (qualquer outro valor conta como Prédio)"""
+    tipo = row.get('tipo_instalacao', 'FTTH')
+    return tipo if tipo in ("FTTH", "Condomínio") else "Prédio"
+
+# ======================
+# Viabilidades Aprovadas
+# ======================
+def approved_feature_collection(rows: List[dict]) -> Tuple[str, Dict[str, int]]:
+    """
+    Viabilidades aprovadas como FeatureCollection GeoJSON serializada
+
+    Returns:
+        tuple: (GeoJSON, contagem de pontos mapeados por tipo)
+    """
+    features = []
+    counts = {tipo: 0 for tipo in APPROVED_STYLES}
+    for row in rows:
+        lat, lon = pluscode_to_coords_or_none(row.get('plus_code_cliente') or "")
+        if lat is None or lon is None:
+            continue
+        tipo = approved_tipo(row)
+        counts[tipo] += 1
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lon, 6), round(lat, 6)]},
+            "properties": {
+                "tipo": tipo,
+                "plus_code": row.get('plus_code_cliente'),
+                "cliente": row.get('nome_cliente'),
+                "usuario": row.get('usuario'),
+                "data": format_time_br_supa(row.get('data_auditoria', '')),
+                "cto": row.get('cto_numero'),
+                "distancia": row.get('distancia_cliente'),
+                "portas": row.get('portas_disponiveis'),
+                "rx": row.get('media_rx') if tipo == "Prédio" else row.get('menor_rx'),
+                "predio": row.get('predio_ftta'),
+                "cdoi": row.get('cdoi'),
+                "auditor": row.get('auditado_por'),
+            }
+        })
+    geojson = json.dumps({"type": "FeatureCollection", "features": features}, ensure_ascii=False, default=str)
+    return geojson, counts
+
+
+class GeoJsonMarkerCluster(MarkerCluster):
+    """
+    Agrupamento de marcadores a partir de uma FeatureCollection serializada
+
+    Args:
+        geojson: FeatureCollection de pontos (texto JSON)
+        point_to_layer: Função JavaScript (feature, latlng) -> marcador
+    """
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var pointToLayer = {{ this.point_to_layer }};
+                var cluster = L.markerClusterGroup({{ this.options|tojson }});
+                var markers = [];
+                L.geoJSON({{ this.geojson }}, {pointToLayer: pointToLayer}).eachLayer(function(layer) {
+                    markers.push(layer);
+                });
+                cluster.addLayers(markers);
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}"""
+    )
+
+    def __init__(self, geojson: str, point_to_layer: str, name: str = None, **kwargs):
+        kwargs.setdefault("chunkedLoading", True)
+        super().__init__(name=name, **kwargs)
+        self._name = "GeoJsonMarkerCluster"
+        # Chaves no formato do Leaflet em qualquer versão do folium
+        self.options = {camelize(key): value for key, value in self.options.items()}
+        self.geojson = embed_json(geojson)
+        self.point_to_layer = point_to_layer.strip()
+
+
+# ======================
+# Grade de Demanda
+# ======================
+def rows_to_coords(rows: List[dict]) -> np.ndarray:
+    """Coordenadas (N x 2, lat/lon) dos Plus Codes válidos das linhas"""
+    coords = [pluscode_to_coords_or_none(row.get('plus_code_cliente') or "") for row in rows]
+    coords = [c for c in coords if c[0] is not None and c[1] is not None]
+    return np.array(coords, dtype=np.float64).reshape(-1, 2)
+
+def grid_cells(coords: np.ndarray, cell_m: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Células da grade (ancorada em reference_lat/lon) de cada ponto
+
+    Returns:
+        tuple: (índices (K x 2) das células ocupadas, contagem por célula)
+    """
+    if not len(coords):
+        return np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+    dlat = cell_m / METERS_PER_DEGREE
+    dlon = cell_m / (METERS_PER_DEGREE * math.cos(math.radians(reference_lat)))
+    cells = np.column_stack([
+        np.floor((coords[:, 0] - reference_lat) / dlat),
+        np.floor((coords[:, 1] - reference_lon) / dlon),
+    ]).astype(np.int64)
+    return np.unique(cells, axis=0, return_counts=True)
+
+def aggregate_demand(aprovadas: np.ndarray, rejeitadas: np.ndarray, cell_m: float) -> Dict[str, np.ndarray]:
+    """
+    Contagem de aprovadas e rejeitadas por célula da grade
+
+    Returns:
+        dict: Arrays alinhados por célula: lat_min, lon_min, lat_max, lon_max,
+        aprovadas, rejeitadas e total
+    """
+    cells_ok, counts_ok = grid_cells(aprovadas, cell_m)
+    cells_nok, counts_nok = grid_cells(rejeitadas, cell_m)
+    cells, inverse = np.unique(np.concatenate([cells_ok, cells_nok]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    n_ok = np.bincount(inverse[:len(cells_ok)], weights=counts_ok, minlength=len(cells)).astype(np.int64)
+    n_nok = np.bincount(inverse[len(cells_ok):], weights=counts_nok, minlength=len(cells)).astype(np.int64)
+
+    dlat = cell_m / METERS_PER_DEGREE
+    dlon = cell_m / (METERS_PER_DEGREE * math.cos(math.radians(reference_lat)))
+    lat_min = reference_lat + cells[:, 0] * dlat
+    lon_min = reference_lon + cells[:, 1] * dlon
+    return {
+        "lat_min": lat_min,
+        "lon_min": lon_min,
+        "lat_max": lat_min + dlat,
+        "lon_max": lon_min + dlon,
+        "aprovadas": n_ok,
+        "rejeitadas": n_nok,
+        "total": n_ok + n_nok,
+    }
+
+@st.cache_data(ttl=DEMAND_CACHE_TTL, show_spinner=False)
+def get_demand_grid(data_inicio: Optional[str], data_fim: Optional[str], cell_m: float) -> Dict[str, np.ndarray]:
+    """Grade de demanda do período (aprovadas de todos os tipos e FTTH rejeitadas), em cache"""
+    aprovadas = rows_to_coords(get_all_approved(data_inicio, data_fim))
+    rejeitadas = rows_to_coords(get_ftth_rejected(data_inicio, data_fim))
+    grid = aggregate_demand(aprovadas, rejeitadas, cell_m)
+    logger.info(
+        f"Grade de demanda ({cell_m:.0f} m): {len(aprovadas)} aprovadas e "
+        f"{len(rejeitadas)} rejeitadas em {len(grid['total'])} células"
+    )
+    return grid
+
+def demand_feature_collection(grid: Dict[str, np.ndarray], metric: str = "total") -> dict:
+    """
+    Células da grade como polígonos GeoJSON, com a cor da faixa de `metric`
+
+    As faixas dividem as células com contagem > 0 em quintis pela posição
+    da contagem; células empatadas ficam na mesma faixa.
+    """
+    values = grid[metric]
+    occupied = np.flatnonzero(values > 0)
+    if not len(occupied):
+        return {"type": "FeatureCollection", "features": []}
+    ranks = np.searchsorted(np.sort(values[occupied]), values[occupied], side="left") / len(occupied)
+    levels = np.minimum((ranks * len(DEMAND_COLORS)).astype(np.int64), len(DEMAND_COLORS) - 1)
+
+    columns = {name: np.round(grid[name][occupied], 6).tolist() for name in ("lat_min", "lon_min", "lat_max", "lon_max")}
+    counts = {name: grid[name][occupied].tolist() for name in ("aprovadas", "rejeitadas", "total")}
+    features = []
+    for i, level in enumerate(levels.tolist()):
+        s, w, n, e = columns["lat_min"][i], columns["lon_min"][i], columns["lat_max"][i], columns["lon_max"][i]
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]]},
+            "properties": {
+                "cor": DEMAND_COLORS[level],
+                "aprovadas": counts["aprovadas"][i],
+                "rejeitadas": counts["rejeitadas"][i],
+                "total": counts["total"][i],
+            }
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+def demand_heat_points(grid: Dict[str, np.ndarray], metric: str = "total") -> List[List[float]]:
+    """Centro das células com contagem > 0 e o peso ([lat, lon, contagem]) para o HeatMap"""
+    values = grid[metric]
+    occupied = np.flatnonzero(values > 0)
+    lats = (grid["lat_min"][occupied] + grid["lat_max"][occupied]) / 2
+    lons = (grid["lon_min"][occupied] + grid["lon_max"][occupied]) / 2
+    return np.column_stack([lats, lons, values[occupied]]).round(6).tolist()
@@ -0,0 +1,199 @@
+"""
+Distâncias a pé offline sobre um grafo de ruas local
+Salve como: road_graph.py
+
+O grafo é lido de um GeoJSON com as vias caminháveis da área atendida
+(LineStrings exportadas do OpenStreetMap, ex.: com osmnx ou ogr2ogr). Vértices
+com as mesmas coordenadas viram o mesmo nó; as arestas recebem a distância
+haversine entre vértices consecutivos. As consultas usam Dijkstra a partir do
+nó do cliente e param assim que todos os destinos foram alcançados.
+"""
+
+import os
+import json
+import heapq
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from geo_index import haversine_m, local_earth_radius
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+ROAD_GRAPH_PATH = os.environ.get("ROAD_GRAPH_PATH", "road_graph.geojson")
+reference_lat = -28.6775
+
+# Casas decimais usadas para unir vértices de vias diferentes (~0.1m)
+NODE_PRECISION = 6
+
+# Distância máxima (m) de um ponto até o nó mais próximo do grafo
+MAX_SNAP_DISTANCE = 200.0
+
+# Velocidade de caminhada usada para estimar a duração (m/s, ~5 km/h)
+WALKING_SPEED = 1.39
+
+# ======================
+# Grafo
+# ======================
+class RoadGraph:
+    """
+    Grafo não direcionado em formato CSR (indptr/indices/weights)
+
+    Args:
+        lines: Lista de vias, cada uma como lista de (lat, lon)
+    """
+
+    def __init__(self, lines: List[List[Tuple[float, float]]]):
+        node_ids: Dict[Tuple[float, float], int] = {}
+        edges = set()
+        self._radius = local_earth_radius(reference_lat)
+
+        for line in lines:
+            prev = None
+            for lat, lon in line:
+                key = (round(lat, NODE_PRECISION), round(lon, NODE_PRECISION))
+                node = node_ids.setdefault(key, len(node_ids))
+                if prev is not None and prev != node:
+                    edges.add((min(prev, node), max(prev, node)))
+                prev = node
+
+        coords = np.array(list(node_ids.keys()), dtype=np.float64).reshape(-1, 2)
+        self.lats = np.ascontiguousarray(coords[:, 0])
+        self.lons = np.ascontiguousarray(coords[:, 1])
+
+        pairs = np.array(sorted(edges), dtype=np.intp).reshape(-1, 2)
+        weights = self._edge_lengths(pairs[:, 0], pairs[:, 1])
+
+        # CSR com as duas direções de cada aresta
+        src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        dst = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        w = np.concatenate([weights, weights])
+        order = np.argsort(src, kind="stable")
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(src, minlength=len(node_ids)))]).tolist()
+        self.indices = dst[order].tolist()
+        self.weights = w[order].tolist()
+
+        logger.info(f"Grafo de ruas: {len(node_ids)} nós, {len(pairs)} arestas")
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _edge_lengths(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        phi1, phi2 = np.radians(self.lats[a]), np.radians(self.lats[b])
+        dlon = np.radians(self.lons[b] - self.lons[a])
+        h = np.sin((phi2 - phi1) * 0.5) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlon * 0.5) ** 2
+        return 2 * self._radius * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+    def nearest_node(self, lat: float, lon: float) -> Tuple[Optional[int], float]:
+        """Nó mais próximo do ponto e a distância até ele (None se longe demais)"""
+        if not len(self):
+            return None, float("inf")
+        dists = haversine_m(lat, lon, self.lats, self.lons, self._radius)
+        node = int(np.argmin(dists))
+        if dists[node] > MAX_SNAP_DISTANCE:
+            return None, float(dists[node])
+        return node, float(dists[node])
+
+    def _dijkstra(self, source: int, targets: set, cutoff: Optional[float] = None):
+        """Distâncias e predecessores a partir de `source` até alcançar todos os `targets`"""
+        dist = {source: 0.0}
+        prev = {source: -1}
+        settled = set()
+        remaining = set(targets)
+        heap = [(0.0, source)]
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+
+        while heap and remaining:
+            d, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            if cutoff is not None and d > cutoff:
+                break
+            settled.add(node)
+            remaining.discard(node)
+            for k in range(indptr[node], indptr[node + 1]):
+                nxt = indices[k]
+                nd = d + weights[k]
+                if nd < dist.get(nxt, float("inf")):
+                    dist[nxt] = nd
+                    prev[nxt] = node
+                    heapq.heappush(heap, (nd, nxt))
+
+        return {n: dist[n] for n in settled}, prev
+
+    def distances_from(self, lat: float, lon: float, destinations: List[Tuple[float, float]],
+                       cutoff: Optional[float] = None) -> List[Optional[float]]:
+        """
+        Distâncias a pé (m) de um ponto até vários destinos em uma única busca
+
+        Inclui o trecho em linha reta do ponto até o nó mais próximo (e do nó
+        até o destino). Destinos fora do grafo ou inalcançáveis ficam com None.
+        """
+        source, snap_src = self.nearest_node(lat, lon)
+        if source is None:
+            return [None] * len(destinations)
+
+        snapped = [self.nearest_node(d_lat, d_lon) for d_lat, d_lon in destinations]
+        targets = {node for node, _ in snapped if node is not None}
+        settled, _ = self._dijkstra(source, targets, cutoff)
+
+        results: List[Optional[float]] = []
+        for node, snap_dst in snapped:
+            if node is None or node not in settled:
+                results.append(None)
+            else:
+                results.append(snap_src + settled[node] + snap_dst)
+        return results
+
+    def route(self, start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> Optional[Dict]:
+        """Rota no mesmo formato do OSRM (distance, duration, geometry GeoJSON)"""
+        source, snap_src = self.nearest_node(start_lat, start_lon)
+        target, snap_dst = self.nearest_node(end_lat, end_lon)
+        if source is None or target is None:
+            return None
+
+        settled, prev = self._dijkstra(source, {target})
+        if target not in settled:
+            return None
+
+        path = []
+        node = target
+        while node != -1:
+            path.append(node)
+            node = prev[node]
+        path.reverse()
+
+        distance = snap_src + settled[target] + snap_dst
+        coordinates = ([[start_lon, start_lat]]
+                       + [[float(self.lons[n]), float(self.lats[n])] for n in path]
+                       + [[end_lon, end_lat]])
+        return {
+            "distance": distance,
+            "duration": distance / WALKING_SPEED,
+            "geometry": {"type": "LineString", "coordinates": coordinates}
+        }
+
+
+def load_road_graph(path: str = ROAD_GRAPH_PATH) -> RoadGraph:
+    """Lê as vias (LineString/MultiLineString) de um GeoJSON e monta o grafo"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    lines = []
+    for feature in data.get("features", []):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "LineString":
+            parts = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiLineString":
+            parts = geometry["coordinates"]
+        else:
+            continue
+        for part in parts:
+            line = [(c[1], c[0]) for c in part if len(c) >= 2]
+            if len(line) > 1:
+                lines.append(line)
+
+    logger.info(f"Carregadas {len(lines)} vias do grafo {path}")
+    return RoadGraph(lines)
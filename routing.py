@@ -0,0 +1,464 @@
+"""
+Cálculo de rotas a pé (OSRM) para as CTOs candidatas
+Salve como: routing.py
+
+A ordenação das candidatas usa uma única requisição `table` do OSRM (1 origem,
+N destinos), que retorna só distâncias. A geometria completa da rota é buscada
+apenas para a CTO que o auditor inspeciona no mapa.
+
+Se a `table` falhar, as rotas são buscadas em paralelo por um pool de threads
+com uma sessão HTTP compartilhada e um orçamento total de tempo. O que não
+responder dentro do orçamento usa a distância em linha reta.
+
+O servidor pode ser trocado pela variável de ambiente OSRM_URL (ex.: um OSRM
+local ou um servidor de teste), lida a cada requisição.
+
+Distâncias e rotas ficam num cache SQLite persistente com as coordenadas
+encaixadas numa grade de 5m, então rotas de casas vizinhas até a mesma CTO
+não voltam ao OSRM.
+
+Com ROUTING_BACKEND = "local" ou "auto" (padrão, se o arquivo do grafo existir)
+as distâncias saem do grafo de ruas offline (road_graph.py); no modo "auto" o
+OSRM só é consultado para o que o grafo não resolver.
+
+Todas as chamadas ao OSRM passam por um circuit breaker compartilhado pelo
+processo: após OSRM_BREAKER_FAILURES falhas/timeouts seguidos ele abre e, por
+OSRM_BREAKER_COOLDOWN segundos, as candidatas usam direto a linha reta em vez
+de esperar o timeout em cada sessão. Com OSRM_HEDGE_AFTER > 0, uma requisição
+sem resposta após esse tempo é duplicada e vale a primeira que responder.
+As latências de cada serviço (route/table) ficam em `routing_stats()`.
+Antes de cada requisição é consumida uma ficha do limite de taxa do OSRM
+(rate_limiter.py), compartilhado entre as sessões.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from disk_cache import SnappedDiskCache
+from rate_limiter import get_limiter, on_page_thread
+from road_graph import ROAD_GRAPH_PATH, WALKING_SPEED, RoadGraph, load_road_graph
+
+logger = logging.getLogger(__name__)
+
+# ======================
+# Configurações
+# ======================
+OSRM_DEFAULT_URL = "http://router.project-osrm.org"
+ROUTING_BACKEND = os.environ.get("ROUTING_BACKEND", "auto")  # "osrm", "local" ou "auto"
+ROUTE_TIMEOUT = 15        # segundos por requisição
+ROUTE_BUDGET = 15         # segundos para todas as candidatas de uma solicitação
+ROUTE_WORKERS = 10
+ROUTE_CACHE_GRID_M = 5.0
+ROUTE_CACHE_MAX_ENTRIES = 50000
+
+# Rotas maiores que N vezes a linha reta são consideradas inválidas
+MAX_DETOUR_FACTOR = 5
+
+# Circuit breaker e requisições duplicadas (hedge)
+OSRM_BREAKER_FAILURES = int(os.environ.get("OSRM_BREAKER_FAILURES", "3"))
+OSRM_BREAKER_COOLDOWN = float(os.environ.get("OSRM_BREAKER_COOLDOWN", "60"))
+OSRM_HEDGE_AFTER = float(os.environ.get("OSRM_HEDGE_AFTER", "0"))  # segundos; 0 desativa
+LATENCY_WINDOW = 200  # últimas respostas consideradas nos percentis
+
+# ======================
+# Sessão e Pool Compartilhados
+# ======================
+_session = requests.Session()
+_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=ROUTE_WORKERS))
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=ROUTE_WORKERS))
+_executor = ThreadPoolExecutor(max_workers=ROUTE_WORKERS, thread_name_prefix="osrm")
+# Pool separado: as requisições HTTP também rodam a partir de threads do _executor
+_http_executor = ThreadPoolExecutor(max_workers=ROUTE_WORKERS * 2, thread_name_prefix="osrm-http")
+
+# Rotas completas (com geometria) e distâncias da `table`, por par cliente/CTO
+route_cache = SnappedDiskCache("routes", grid_m=ROUTE_CACHE_GRID_M, max_entries=ROUTE_CACHE_MAX_ENTRIES)
+distance_cache = SnappedDiskCache("route_distances", grid_m=ROUTE_CACHE_GRID_M, max_entries=ROUTE_CACHE_MAX_ENTRIES)
+
+# ======================
+# Circuit Breaker e Latências
+# ======================
+class CircuitOpenError(requests.RequestException):
+    """OSRM considerado fora do ar; a chamada nem é feita"""
+
+
+class RateLimitedError(requests.RequestException):
+    """Sem ficha no limite de taxa do OSRM dentro do timeout"""
+
+
+class CircuitBreaker:
+    """
+    Abre após `failures` falhas seguidas e rejeita chamadas por `cooldown` s
+
+    Passado o cooldown, deixa uma única chamada de teste (meio-aberto): se
+    ela funcionar o circuito fecha, se falhar abre de novo.
+    """
+
+    def __init__(self, failures: int = OSRM_BREAKER_FAILURES, cooldown: float = OSRM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "fechado"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "aberto"
+            return "meio-aberto"
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "aberto"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def release(self) -> None:
+        """Devolve a vaga de teste liberada por `allow` quando a chamada não chegou a ser feita"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("OSRM: circuito fechado")
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self._trial_running or (self._opened_at is None and self._consecutive >= self.failures):
+                logger.warning(f"OSRM: circuito aberto por {self.cooldown:.0f}s após {self._consecutive} falha(s)")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class LatencyTracker:
+    """Percentis das últimas latências (s) de cada serviço do OSRM"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._window = window
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(endpoint, deque(maxlen=self._window)).append(seconds)
+
+    def percentiles(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            samples = {endpoint: sorted(values) for endpoint, values in self._samples.items()}
+        result = {}
+        for endpoint, values in samples.items():
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            result[endpoint] = {"count": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99)}
+        return result
+
+
+osrm_breaker = CircuitBreaker()
+osrm_latency = LatencyTracker()
+
+def _hedged_get(url: str, params: dict, timeout: float) -> requests.Response:
+    """GET com uma cópia disparada após OSRM_HEDGE_AFTER s; vale a primeira resposta"""
+    if OSRM_HEDGE_AFTER <= 0:
+        return _session.get(url, params=params, timeout=timeout)
+
+    first = _http_executor.submit(_session.get, url, params=params, timeout=timeout)
+    done, _ = wait([first], timeout=OSRM_HEDGE_AFTER)
+    # A cópia também consome uma ficha; sem ficha, espera só a original
+    if done or get_limiter("osrm").bucket.try_acquire() > 0:
+        return first.result()
+
+    pending = {first, _http_executor.submit(_session.get, url, params=params, timeout=timeout)}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+def _osrm_get(endpoint: str, url: str, params: dict, timeout: float) -> requests.Response:
+    """
+    Requisição ao OSRM passando pelo circuit breaker e pelo limite de taxa
+
+    Com o circuito aberto nenhuma ficha é consumida. Na thread da página não
+    se espera ficha: sem ficha livre a chamada falha na hora (RateLimitedError)
+    e quem chamou usa a linha reta, como com o circuito aberto.
+    """
+    if not osrm_breaker.allow():
+        raise CircuitOpenError("circuito aberto")
+    limiter = get_limiter("osrm")
+    if on_page_thread():
+        acquired = limiter.bucket.try_acquire() == 0
+    else:
+        acquired = limiter.acquire(timeout=timeout)
+    if not acquired:
+        osrm_breaker.release()
+        raise RateLimitedError("limite de requisições do OSRM")
+
+    start = time.monotonic()
+    try:
+        response = _hedged_get(url, params, timeout)
+    except Exception:
+        osrm_breaker.record_failure()
+        raise
+
+    osrm_latency.record(endpoint, time.monotonic() - start)
+    if response.status_code >= 500 or response.status_code == 429:
+        osrm_breaker.record_failure()
+    else:
+        osrm_breaker.record_success()
+    return response
+
+def routing_stats() -> Dict:
+    """Estado do circuit breaker e percentis de latência por serviço"""
+    return {"circuito": osrm_breaker.state, "latencias": osrm_latency.percentiles()}
+
+_graph_lock = threading.Lock()
+_graph_state = {"loaded": False, "graph": None}
+
+# ======================
+# Grafo Local
+# ======================
+def get_local_graph() -> Optional[RoadGraph]:
+    """Grafo de ruas offline (carregado uma vez), ou None se desativado/ausente"""
+    if ROUTING_BACKEND == "osrm":
+        return None
+    if not _graph_state["loaded"]:
+        with _graph_lock:
+            if not _graph_state["loaded"]:
+                if os.path.exists(ROAD_GRAPH_PATH):
+                    try:
+                        _graph_state["graph"] = load_road_graph(ROAD_GRAPH_PATH)
+                    except Exception as e:
+                        logger.error(f"Erro ao carregar grafo de ruas {ROAD_GRAPH_PATH}: {e}")
+                elif ROUTING_BACKEND == "local":
+                    logger.error(f"ROUTING_BACKEND=local, mas {ROAD_GRAPH_PATH} não existe")
+                _graph_state["loaded"] = True
+    return _graph_state["graph"]
+
+def _osrm_url() -> str:
+    """Servidor OSRM atual; a variável OSRM_URL é lida a cada chamada"""
+    return os.environ.get("OSRM_URL", OSRM_DEFAULT_URL).rstrip("/")
+
+def _osrm_enabled() -> bool:
+    return ROUTING_BACKEND != "local"
+
+# ======================
+# Rotas
+# ======================
+def fetch_walking_route(start_lat: float, start_lon: float, end_lat: float, end_lon: float,
+                        timeout: float = ROUTE_TIMEOUT) -> Optional[Dict]:
+    """Consulta o OSRM (sem cache); retorna distance, duration e geometry ou None"""
+    try:
+        url = f"{_osrm_url()}/route/v1/foot/{start_lon},{start_lat};{end_lon},{end_lat}"
+        params = {
+            "overview": "full",
+            "geometries": "geojson",
+            "steps": "false"
+        }
+
+        response = _osrm_get("route", url, params, timeout)
+
+        if response.status_code == 200:
+            data = response.json()
+            if data.get("code") == "Ok" and data.get("routes"):
+                route = data["routes"][0]
+                return {
+                    "distance": route["distance"],
+                    "duration": route["duration"],
+                    "geometry": route["geometry"]
+                }
+            logger.warning("OSRM: Nenhuma rota encontrada")
+            return None
+        logger.warning(f"OSRM API retornou status {response.status_code}")
+        return None
+
+    except (CircuitOpenError, RateLimitedError):
+        return None
+    except requests.Timeout:
+        logger.error("OSRM: Timeout na requisição")
+        return None
+    except requests.RequestException as e:
+        logger.error(f"Erro ao consultar OSRM API: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Erro inesperado na rota: {e}")
+        return None
+
+def get_walking_route(start_lat: float, start_lon: float, end_lat: float, end_lon: float,
+                      timeout: float = ROUTE_TIMEOUT) -> Optional[Dict]:
+    """Rota a pé: grafo local, depois cache persistente, depois OSRM"""
+    graph = get_local_graph()
+    if graph is not None:
+        route = graph.route(start_lat, start_lon, end_lat, end_lon)
+        if route or not _osrm_enabled():
+            return route
+
+    start, end = (start_lat, start_lon), (end_lat, end_lon)
+    cached = route_cache.get(start, end)
+    if cached:
+        return cached
+
+    route = fetch_walking_route(start_lat, start_lon, end_lat, end_lon, timeout=timeout)
+    if route:
+        route_cache.put(start, end, value=route)
+        distance_cache.put(start, end, value={"distance": route["distance"], "duration": route["duration"]})
+    return route
+
+def fetch_walking_distances(lat: float, lon: float, destinations: List[Tuple[float, float]],
+                            timeout: float = ROUTE_TIMEOUT) -> Optional[List[Optional[Dict]]]:
+    """
+    Distâncias a pé de um ponto até vários destinos em uma requisição `table`
+
+    Destinos já presentes no cache não entram na requisição.
+
+    Returns:
+        list: Um item por destino ({"distance", "duration"} ou None se o OSRM
+        não achou caminho); None se a requisição falhou.
+    """
+    results: List[Optional[Dict]] = [None] * len(destinations)
+    graph = get_local_graph()
+    if graph is not None:
+        for i, dist in enumerate(graph.distances_from(lat, lon, destinations)):
+            if dist is not None:
+                results[i] = {"distance": dist, "duration": dist / WALKING_SPEED, "geometry": None}
+        if not _osrm_enabled():
+            return results
+
+    missing = []
+    for i, dest in enumerate(destinations):
+        if results[i] is not None:
+            continue
+        cached = distance_cache.get((lat, lon), dest)
+        if cached:
+            results[i] = {**cached, "geometry": None}
+        else:
+            missing.append(i)
+    if not missing:
+        return results
+
+    fetched = _fetch_table(lat, lon, [destinations[i] for i in missing], timeout)
+    if fetched is None:
+        return None
+    for i, item in zip(missing, fetched):
+        results[i] = item
+        if item:
+            distance_cache.put((lat, lon), destinations[i], value={"distance": item["distance"], "duration": item["duration"]})
+    return results
+
+def _fetch_table(lat: float, lon: float, destinations: List[Tuple[float, float]],
+                 timeout: float) -> Optional[List[Optional[Dict]]]:
+    """Requisição `table` do OSRM (sem cache)"""
+    try:
+        coords = ";".join([f"{lon},{lat}"] + [f"{d_lon},{d_lat}" for d_lat, d_lon in destinations])
+        url = f"{_osrm_url()}/table/v1/foot/{coords}"
+        params = {
+            "sources": "0",
+            "destinations": ";".join(str(i) for i in range(1, len(destinations) + 1)),
+            "annotations": "distance,duration"
+        }
+
+        response = _osrm_get("table", url, params, timeout)
+
+        if response.status_code != 200:
+            logger.warning(f"OSRM table retornou status {response.status_code}")
+            return None
+        data = response.json()
+        if data.get("code") != "Ok" or not data.get("distances"):
+            logger.warning(f"OSRM table sem resultado: {data.get('code')}")
+            return None
+
+        distances = data["distances"][0]
+        durations = (data.get("durations") or [[None] * len(distances)])[0]
+        return [
+            {"distance": dist, "duration": dur, "geometry": None} if dist is not None else None
+            for dist, dur in zip(distances, durations)
+        ]
+
+    except (CircuitOpenError, RateLimitedError):
+        return None
+    except requests.Timeout:
+        logger.error("OSRM table: Timeout na requisição")
+        return None
+    except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+        logger.error(f"Erro ao consultar OSRM table: {e}")
+        return None
+
+def _fetch_routes_concurrently(lat: float, lon: float, candidates: List[dict], budget: float) -> List[Optional[Dict]]:
+    """Uma requisição `route` por candidata, em paralelo, limitada ao orçamento"""
+    deadline = time.monotonic() + budget
+    futures = [
+        _executor.submit(get_walking_route, lat, lon, cto["lat"], cto["lon"], min(ROUTE_TIMEOUT, budget))
+        for cto in candidates
+    ]
+    wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+    pending = sum(1 for f in futures if not f.done())
+    if pending:
+        logger.warning(f"OSRM: {pending} rota(s) sem resposta no orçamento de {budget}s, usando linha reta")
+    return [f.result() if f.done() and not f.exception() else None for f in futures]
+
+def rank_ctos_by_route(lat: float, lon: float, candidates: List[dict], limit: int = 10, keep: int = 5,
+                       budget: float = ROUTE_BUDGET) -> List[dict]:
+    """
+    Ordena as CTOs candidatas pela distância a pé
+
+    Args:
+        lat, lon: Coordenadas do cliente
+        candidates: CTOs ordenadas por distância em linha reta (chave "distance")
+        limit: Quantas candidatas consultar no OSRM
+        keep: Quantas manter no resultado
+        budget: Tempo máximo (s) de espera por todas as rotas
+
+    Returns:
+        list: Itens {"cto", "route", "distance"}; "route" é None quando a rota
+        não respondeu a tempo ou falhou (distância em linha reta). A chave
+        "geometry" da rota vem vazia quando a distância saiu da `table`; use
+        `get_walking_route` para desenhar a rota de uma CTO específica.
+    """
+    candidates = candidates[:limit]
+    deadline = time.monotonic() + budget
+    routes = fetch_walking_distances(lat, lon, [(cto["lat"], cto["lon"]) for cto in candidates],
+                                     timeout=min(ROUTE_TIMEOUT, budget))
+    if routes is None:
+        remaining = deadline - time.monotonic()
+        # Sem ficha livre na thread da página, vale o mesmo que circuito aberto
+        throttled = on_page_thread() and get_limiter("osrm").bucket.available() < 1
+        if remaining > 0 and not osrm_breaker.is_open and not throttled:
+            routes = _fetch_routes_concurrently(lat, lon, candidates, remaining)
+        else:
+            routes = [None] * len(candidates)
+
+    cto_routes = []
+    for cto, route in zip(candidates, routes):
+        if route:
+            # A linha reta vem do índice de CTOs (geodésica nas primeiras candidatas)
+            if route["distance"] > cto["distance"] * MAX_DETOUR_FACTOR:
+                route["distance"] = cto["distance"]
+            cto_routes.append({"cto": cto, "route": route, "distance": route["distance"]})
+        else:
+            cto_routes.append({"cto": cto, "route": None, "distance": cto["distance"]})
+
+    cto_routes.sort(key=lambda x: x["distance"])
+    return cto_routes[:keep]
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Módulos do projeto ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Caches SQLite/manifesto dos testes fora da pasta .cache do projeto
+os.environ.setdefault("VIABILIDADE_CACHE_DIR", tempfile.mkdtemp(prefix="viabilidade-tests-"))
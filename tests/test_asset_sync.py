@@ -0,0 +1,96 @@
+import os
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import pytest
+import asset_sync
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """Servidor de arquivos local no lugar do Google Drive"""
+    served = tmp_path / "servidor"
+    local = tmp_path / "local"
+    served.mkdir()
+    local.mkdir()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=str(served)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(asset_sync, "ASSET_BASE_URL", f"http://127.0.0.1:{httpd.server_address[1]}")
+    monkeypatch.setattr(asset_sync, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(asset_sync, "MANIFEST_PATH", str(tmp_path / "cache" / "assets_manifest.json"))
+    yield served, local
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _publish(path, content, mtime):
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+
+
+def test_unchanged_file_keeps_mtime(server):
+    served, local = server
+    _publish(served / "ctos.kml", b"<kml>v1</kml>", 1_700_000_000)
+    target = str(local / "ctos.kml")
+
+    first = asset_sync.sync_assets({"ctos": ("id", target)})
+    os.utime(target, (1_600_000_000, 1_600_000_000))
+
+    # 304: If-Modified-Since com a data da versão anterior
+    second = asset_sync.sync_assets({"ctos": ("id", target)})
+    assert second["ctos"]["sha256"] == first["ctos"]["sha256"]
+    assert os.path.getmtime(target) == 1_600_000_000
+
+    # Resposta 200 com o mesmo conteúdo: hash igual, arquivo mantido
+    os.utime(served / "ctos.kml", (1_800_000_000, 1_800_000_000))
+    third = asset_sync.sync_assets({"ctos": ("id", target)})
+    assert third["ctos"]["sha256"] == first["ctos"]["sha256"]
+    assert os.path.getmtime(target) == 1_600_000_000
+
+
+def test_changed_file_is_replaced(server):
+    served, local = server
+    _publish(served / "ctos.kml", b"<kml>v1</kml>", 1_700_000_000)
+    target = str(local / "ctos.kml")
+    first = asset_sync.sync_assets({"ctos": ("id", target)})
+
+    _publish(served / "ctos.kml", b"<kml>v2, mais CTOs</kml>", 1_700_000_100)
+    second = asset_sync.sync_assets({"ctos": ("id", target)})
+
+    assert second["ctos"]["sha256"] != first["ctos"]["sha256"]
+    assert (local / "ctos.kml").read_bytes() == b"<kml>v2, mais CTOs</kml>"
+    assert asset_sync.asset_version("ctos") == second["ctos"]["sha256"][:16]
+    assert not [name for name in os.listdir(local) if ".tmp" in name]
+
+
+def test_failed_download_with_local_copy_is_kept(server):
+    served, local = server
+    _publish(served / "ctos.kml", b"<kml>v1</kml>", 1_700_000_000)
+    target = str(local / "ctos.kml")
+    first = asset_sync.sync_assets({"ctos": ("id", target)})
+
+    (served / "ctos.kml").unlink()  # servidor responde 404
+    result = asset_sync.sync_assets({"ctos": ("id", target)})
+
+    assert result["ctos"]["sha256"] == first["ctos"]["sha256"]
+    assert (local / "ctos.kml").read_bytes() == b"<kml>v1</kml>"
+
+
+def test_failed_download_without_local_copy_is_left_out(server):
+    served, local = server
+    _publish(served / "linhas.kml", b"<kml>linhas</kml>", 1_700_000_000)
+    assets = {"ctos": ("id", str(local / "ctos.kml")), "linhas": ("id", str(local / "linhas.kml"))}
+
+    result = asset_sync.sync_assets(assets)
+
+    assert set(result) == {"linhas"}
+    assert not (local / "ctos.kml").exists()
+    with pytest.raises(Exception):
+        asset_sync.sync_asset("ctos", "id", str(local / "ctos.kml"))
@@ -0,0 +1,16 @@
+import pytest
+from geocoding import pluscode_to_coords, pluscode_to_coords_or_none
+
+
+def test_short_code_is_recovered_near_reference():
+    lat, lon = pluscode_to_coords(" 8j3g+wgv ")
+    assert lat == pytest.approx(-28.695, abs=0.01)
+    assert lon == pytest.approx(-49.37, abs=0.01)
+    assert pluscode_to_coords("583G8J3G+WGV") == pytest.approx((lat, lon))
+
+
+def test_invalid_code_is_rejected():
+    with pytest.raises(ValueError):
+        pluscode_to_coords("8J3G WGV")
+    assert pluscode_to_coords_or_none("8J3G WGV") == (None, None)
+    assert pluscode_to_coords_or_none(None) == (None, None)
@@ -0,0 +1,70 @@
+import time
+import pytest
+import routing
+from rate_limiter import TokenBucket
+from routing import CircuitBreaker, CircuitOpenError, RateLimitedError
+
+
+class _Limiter:
+    def __init__(self, tokens):
+        self.bucket = TokenBucket(rate=0.001, capacity=1)
+        self.bucket._tokens = float(tokens)
+
+    def acquire(self, timeout=None):
+        return self.bucket.acquire(timeout)
+
+
+def _no_http(*args, **kwargs):
+    raise AssertionError("requisição não deveria sair")
+
+
+@pytest.fixture
+def osrm(monkeypatch):
+    def setup(tokens, page_thread=True, breaker=None):
+        limiter = _Limiter(tokens)
+        monkeypatch.setattr(routing, "get_limiter", lambda provider: limiter)
+        monkeypatch.setattr(routing, "on_page_thread", lambda: page_thread)
+        monkeypatch.setattr(routing, "osrm_breaker", breaker or CircuitBreaker())
+        monkeypatch.setattr(routing, "_hedged_get", _no_http)
+        return limiter
+    return setup
+
+
+def test_page_thread_without_token_fails_fast(osrm):
+    osrm(tokens=0)
+    start = time.monotonic()
+    with pytest.raises(RateLimitedError):
+        routing._osrm_get("table", "http://osrm", {}, timeout=15)
+    assert time.monotonic() - start < 0.5
+
+
+def test_open_circuit_does_not_take_a_token(osrm):
+    breaker = CircuitBreaker(failures=1, cooldown=60)
+    breaker.record_failure()
+    limiter = osrm(tokens=1, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        routing._osrm_get("table", "http://osrm", {}, timeout=15)
+    assert limiter.bucket.available() >= 1
+
+
+def test_half_open_trial_released_when_throttled(osrm):
+    breaker = CircuitBreaker(failures=1, cooldown=0)
+    breaker.record_failure()
+    osrm(tokens=0, breaker=breaker)
+    with pytest.raises(RateLimitedError):
+        routing._osrm_get("table", "http://osrm", {}, timeout=15)
+    # A vaga de teste volta a ficar livre
+    assert breaker.allow()
+
+
+def test_throttled_table_falls_back_to_straight_line(osrm, monkeypatch):
+    osrm(tokens=0)
+    monkeypatch.setattr(routing, "get_local_graph", lambda: None)
+    monkeypatch.setattr(routing, "_fetch_routes_concurrently", _no_http)
+    candidates = [{"lat": -28.68, "lon": -49.37, "distance": 120.0}, {"lat": -28.681, "lon": -49.371, "distance": 80.0}]
+    lat, lon = -28.70, -49.40  # longe de qualquer entrada do cache
+
+    result = routing.rank_ctos_by_route(lat, lon, candidates, budget=5)
+
+    assert [item["distance"] for item in result] == [80.0, 120.0]
+    assert all(item["route"] is None for item in result)
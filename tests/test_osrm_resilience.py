@@ -0,0 +1,122 @@
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import routing
+from rate_limiter import TokenBucket
+from routing import CircuitBreaker, CircuitOpenError, LatencyTracker
+
+
+class _Limiter:
+    def __init__(self):
+        self.bucket = TokenBucket(rate=1000, capacity=100)
+
+    def acquire(self, timeout=None):
+        return self.bucket.acquire(timeout)
+
+
+class _OSRMHandler(BaseHTTPRequestHandler):
+    """OSRM falso: cada requisição consome o próximo (status, atraso) de `server.replies`"""
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.count += 1
+            status, delay = self.server.replies.pop(0) if self.server.replies else self.server.default
+        time.sleep(delay)
+        body = b'{"code": "Ok"}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def osrm_server(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _OSRMHandler)
+    httpd.lock = threading.Lock()
+    httpd.count = 0
+    httpd.replies = []
+    httpd.default = (200, 0)
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/table/v1/foot/0,0;1,1"
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(routing, "get_limiter", lambda provider: _Limiter())
+    monkeypatch.setattr(routing, "on_page_thread", lambda: False)
+    monkeypatch.setattr(routing, "osrm_latency", LatencyTracker())
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_breaker_opens_after_consecutive_failures(osrm_server, monkeypatch):
+    breaker = CircuitBreaker(failures=3, cooldown=60)
+    monkeypatch.setattr(routing, "osrm_breaker", breaker)
+    osrm_server.default = (500, 0)
+
+    for _ in range(3):
+        assert routing._osrm_get("table", osrm_server.url, {}, timeout=5).status_code == 500
+    assert breaker.state == "aberto"
+
+    with pytest.raises(CircuitOpenError):
+        routing._osrm_get("table", osrm_server.url, {}, timeout=5)
+    assert osrm_server.count == 3
+
+
+def test_half_open_trial_closes_or_reopens(osrm_server, monkeypatch):
+    breaker = CircuitBreaker(failures=1, cooldown=0.2)
+    monkeypatch.setattr(routing, "osrm_breaker", breaker)
+    osrm_server.replies = [(500, 0), (500, 0)]
+
+    routing._osrm_get("table", osrm_server.url, {}, timeout=5)
+    assert breaker.state == "aberto"
+
+    # Passado o cooldown, uma chamada de teste; falhou, abre de novo
+    time.sleep(0.25)
+    assert breaker.state == "meio-aberto"
+    routing._osrm_get("table", osrm_server.url, {}, timeout=5)
+    assert breaker.state == "aberto"
+
+    # Nova chamada de teste com o servidor de volta: circuito fecha
+    time.sleep(0.25)
+    assert routing._osrm_get("table", osrm_server.url, {}, timeout=5).status_code == 200
+    assert breaker.state == "fechado"
+    assert osrm_server.count == 3
+
+
+def test_hedged_request_fires_after_delay(osrm_server, monkeypatch):
+    monkeypatch.setattr(routing, "osrm_breaker", CircuitBreaker())
+    monkeypatch.setattr(routing, "OSRM_HEDGE_AFTER", 0.1)
+    osrm_server.replies = [(200, 2.0), (200, 0)]
+
+    start = time.monotonic()
+    response = routing._osrm_get("table", osrm_server.url, {}, timeout=5)
+
+    assert response.status_code == 200
+    assert time.monotonic() - start < 1.0
+    assert osrm_server.count == 2
+
+
+def test_fast_response_is_not_hedged(osrm_server, monkeypatch):
+    monkeypatch.setattr(routing, "osrm_breaker", CircuitBreaker())
+    monkeypatch.setattr(routing, "OSRM_HEDGE_AFTER", 0.5)
+
+    routing._osrm_get("table", osrm_server.url, {}, timeout=5)
+
+    assert osrm_server.count == 1
+
+
+def test_latency_percentiles():
+    tracker = LatencyTracker(window=100)
+    for ms in range(1, 151):  # só as últimas 100 (51..150) ficam na janela
+        tracker.record("table", ms / 1000)
+    tracker.record("route", 0.3)
+
+    stats = tracker.percentiles()
+
+    assert stats["table"] == {"count": 100, "p50": 0.101, "p90": 0.141, "p99": 0.15}
+    assert stats["route"] == {"count": 1, "p50": 0.3, "p90": 0.3, "p99": 0.3}
@@ -0,0 +1,103 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import pytest
+import routing
+from disk_cache import SnappedDiskCache
+from rate_limiter import TokenBucket
+from routing import CircuitBreaker
+
+
+class _Limiter:
+    def __init__(self):
+        self.bucket = TokenBucket(rate=1000, capacity=100)
+
+    def acquire(self, timeout=None):
+        return self.bucket.acquire(timeout)
+
+
+class _OSRMHandler(BaseHTTPRequestHandler):
+    """OSRM falso: responde `table` com uma distância por destino da URL"""
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        self.server.requests.append(path)
+        coords = path.rsplit("/", 1)[-1].split(";")
+        distances = [self.server.distances.get(coord) for coord in coords[1:]]
+        body = json.dumps({
+            "code": "Ok",
+            "distances": [distances],
+            "durations": [[d / 1.4 if d is not None else None for d in distances]]
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def osrm_server(tmp_path, monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _OSRMHandler)
+    httpd.requests = []
+    httpd.distances = {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setenv("OSRM_URL", f"http://127.0.0.1:{httpd.server_address[1]}/")
+    monkeypatch.setattr(routing, "get_local_graph", lambda: None)
+    monkeypatch.setattr(routing, "get_limiter", lambda provider: _Limiter())
+    monkeypatch.setattr(routing, "on_page_thread", lambda: False)
+    monkeypatch.setattr(routing, "osrm_breaker", CircuitBreaker())
+    monkeypatch.setattr(routing, "distance_cache", SnappedDiskCache(f"distances_{tmp_path.name}"))
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+ORIGIN = (-28.6800, -49.3700)
+DESTS = [(-28.6810, -49.3710), (-28.6820, -49.3720), (-28.6830, -49.3730)]
+
+
+def _coord(point):
+    return f"{point[1]},{point[0]}"
+
+
+def test_table_is_parsed_per_destination(osrm_server):
+    osrm_server.distances = {_coord(DESTS[0]): 150.0, _coord(DESTS[1]): 280.0, _coord(DESTS[2]): 420.0}
+
+    result = routing.fetch_walking_distances(*ORIGIN, DESTS)
+
+    assert [item["distance"] for item in result] == [150.0, 280.0, 420.0]
+    assert result[0]["duration"] == pytest.approx(150.0 / 1.4)
+    assert all(item["geometry"] is None for item in result)
+    assert osrm_server.requests == [f"/table/v1/foot/{_coord(ORIGIN)};" + ";".join(_coord(d) for d in DESTS)]
+
+
+def test_null_distance_means_no_route(osrm_server):
+    osrm_server.distances = {_coord(DESTS[0]): 150.0, _coord(DESTS[2]): 420.0}
+
+    result = routing.fetch_walking_distances(*ORIGIN, DESTS)
+
+    assert result[1] is None
+    assert [result[0]["distance"], result[2]["distance"]] == [150.0, 420.0]
+    # Destino sem caminho não vai para o cache
+    assert routing.distance_cache.get(ORIGIN, DESTS[1]) is None
+
+
+def test_only_uncached_destinations_are_requested(osrm_server):
+    routing.distance_cache.put(ORIGIN, DESTS[1], value={"distance": 999.0, "duration": 700.0})
+    osrm_server.distances = {_coord(DESTS[0]): 150.0, _coord(DESTS[2]): 420.0}
+
+    result = routing.fetch_walking_distances(*ORIGIN, DESTS)
+
+    assert [item["distance"] for item in result] == [150.0, 999.0, 420.0]
+    assert osrm_server.requests == [f"/table/v1/foot/{_coord(ORIGIN)};{_coord(DESTS[0])};{_coord(DESTS[2])}"]
+
+    # Segunda consulta sai toda do cache
+    routing.fetch_walking_distances(*ORIGIN, DESTS)
+    assert len(osrm_server.requests) == 1
@@ -0,0 +1,51 @@
+import sqlite3
+import os
+import time
+import precompute
+from precompute import PrecomputeStore
+
+DATA = {"lat": -28.6775, "lon": -49.3696, "endereco": None, "cto_routes": [], "linhas": []}
+
+
+def test_catalog_version_and_plus_code(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompute, "CACHE_DIR", str(tmp_path))
+    store = PrecomputeStore("pc")
+    store.put("1", "58X8+XX", "v1", DATA, ttl=60)
+
+    assert store.get("1", "58X8+XX", "v1") == DATA
+    assert store.get("1", "58X8+XX", "v2") is None  # KML de CTOs novo
+    assert store.get("1", "58X9+XX", "v1") is None  # Plus Code editado
+
+
+def test_expired_result_is_a_miss(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompute, "CACHE_DIR", str(tmp_path))
+    store = PrecomputeStore("pc")
+    store.put("1", "58X8+XX", "v1", DATA, ttl=-1)
+    assert store.get("1", "58X8+XX", "v1") is None
+
+
+def test_eviction_keeps_newest(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompute, "CACHE_DIR", str(tmp_path))
+    store = PrecomputeStore("pc", max_entries=10)
+    for i in range(25):
+        store.put(str(i), "58X8+XX", "v1", DATA, ttl=60)
+        time.sleep(0.001)
+
+    assert store._count <= 10
+    assert store.get("24", "58X8+XX", "v1") == DATA
+    assert store.get("0", "58X8+XX", "v1") is None
+
+
+def test_old_schema_is_replaced(tmp_path, monkeypatch):
+    monkeypatch.setattr(precompute, "CACHE_DIR", str(tmp_path))
+    conn = sqlite3.connect(os.path.join(str(tmp_path), "pc.sqlite"))
+    conn.execute("CREATE TABLE precomputed (request_id TEXT PRIMARY KEY, plus_code TEXT NOT NULL, "
+                 "data TEXT NOT NULL, computed_at REAL NOT NULL)")
+    conn.execute("INSERT INTO precomputed VALUES ('1', '58X8+XX', '{}', 0)")
+    conn.commit()
+    conn.close()
+
+    store = PrecomputeStore("pc")
+    assert store.get("1", "58X8+XX", "v1") is None
+    store.put("1", "58X8+XX", "v1", DATA, ttl=60)
+    assert store.get("1", "58X8+XX", "v1") == DATA
@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+import routing
+from geo_index import haversine_m, local_earth_radius
+from road_graph import RoadGraph, MAX_SNAP_DISTANCE, WALKING_SPEED, reference_lat
+
+BASE_LAT, BASE_LON = -28.6775, -49.3696
+STEP = 0.001  # ~111 m em latitude, ~98 m em longitude
+SIZE = 5
+
+
+def node(i, j):
+    return (BASE_LAT + i * STEP, BASE_LON + j * STEP)
+
+
+def segment(a, b):
+    return float(haversine_m(a[0], a[1], np.array([b[0]]), np.array([b[1]]), local_earth_radius(reference_lat))[0])
+
+
+@pytest.fixture
+def graph():
+    # Grade 5x5: linhas e colunas como vias
+    lines = [[node(i, j) for j in range(SIZE)] for i in range(SIZE)]
+    lines += [[node(i, j) for i in range(SIZE)] for j in range(SIZE)]
+    # Via isolada a ~1,1 km, sem ligação com a grade
+    lines.append([node(10, 0), node(10, 1)])
+    return RoadGraph(lines)
+
+
+def test_distances_from(graph):
+    lat_step = segment(node(0, 0), node(1, 0))
+    lon_step = segment(node(0, 0), node(0, 1))
+    far_away = (BASE_LAT + 0.05, BASE_LON + 0.05)
+
+    dists = graph.distances_from(*node(0, 0), [node(4, 4), node(0, 0), node(2, 0), node(10, 1), far_away])
+
+    assert dists[0] == pytest.approx(4 * lat_step + 4 * lon_step, rel=1e-3)
+    assert dists[1] == 0.0
+    assert dists[2] == pytest.approx(2 * lat_step, rel=1e-3)
+    assert dists[3] is None  # via isolada: inalcançável
+    assert dists[4] is None  # além de MAX_SNAP_DISTANCE
+    assert segment(node(4, 4), far_away) > MAX_SNAP_DISTANCE
+
+
+def test_distances_from_source_off_graph(graph):
+    assert graph.distances_from(BASE_LAT + 0.05, BASE_LON + 0.05, [node(0, 0)]) == [None]
+
+
+def test_route(graph):
+    start, end = node(0, 0), node(0, 3)
+    route = graph.route(*start, *end)
+
+    expected = 3 * segment(node(0, 0), node(0, 1))
+    assert route["distance"] == pytest.approx(expected, rel=1e-3)
+    assert route["duration"] == pytest.approx(route["distance"] / WALKING_SPEED)
+    coords = route["geometry"]["coordinates"]
+    assert route["geometry"]["type"] == "LineString"
+    assert coords[0] == [start[1], start[0]]
+    assert coords[-1] == [end[1], end[0]]
+    # Caminho ao longo da primeira linha da grade
+    assert [pytest.approx(c[1]) for c in coords[1:-1]] == [BASE_LAT] * 4
+
+
+def test_route_unreachable(graph):
+    assert graph.route(*node(0, 0), *node(10, 1)) is None
+
+
+def test_local_backend_fallback(graph, monkeypatch):
+    monkeypatch.setattr(routing, "ROUTING_BACKEND", "local")
+    monkeypatch.setattr(routing, "_graph_state", {"loaded": True, "graph": graph})
+
+    def no_osrm(*args, **kwargs):
+        raise AssertionError("OSRM não deve ser consultado com ROUTING_BACKEND=local")
+
+    monkeypatch.setattr(routing, "_fetch_table", no_osrm)
+
+    results = routing.fetch_walking_distances(*node(0, 0), [node(4, 4), node(10, 1)])
+
+    assert results[0]["distance"] == pytest.approx(graph.distances_from(*node(0, 0), [node(4, 4)])[0])
+    assert results[0]["duration"] == pytest.approx(results[0]["distance"] / WALKING_SPEED)
+    assert results[0]["geometry"] is None
+    assert results[1] is None
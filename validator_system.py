@@ -1,19 +1,19 @@
 import streamlit as st
-import xml.etree.ElementTree as ET
-from shapely.geometry import LineString, Point
 from openlocationcode import openlocationcode as olc
-from geopy.distance import geodesic
 import folium
 from streamlit_folium import st_folium
-import gdown
 import pandas as pd
-import requests
+import time
 import logging
 from datetime import datetime
-import time
-from typing import Optional, Tuple, List, Dict
 import re
 import supabase_config
+from cto_catalog import get_cto_catalog, refresh_cto_catalog
+from project_lines import get_project_lines, refresh_project_lines, format_line_proximity
+from routing import rank_ctos_by_route, route_cache, distance_cache, routing_stats
+from geocoding import GEOCODE_WAIT, lookup_address_async, pending_address, pluscode_to_coords
+from precompute import get_precomputed
+from asset_sync import sync_assets
 
 # Importar depois para evitar problemas de dependência circular
 from viability_functions import (
@@ -22,7 +22,6 @@ from viability_functions import (
     format_time_br,
     get_ftth_pending_search,
     save_selected_cto,
-    validate_plus_code,
     update_viability_ftth
 )
 from login_system import require_authentication
@@ -30,51 +29,6 @@ from login_system import require_authentication
 # ======================
 # Configurações
 # ======================
-LOCATIONIQ_KEY = "pk.66f355328aaad40fe69b57c293f66815"
-reference_lat = -28.6775
-reference_lon = -49.3696
-file_id_ctos = "1EcKNk2yqHDEMMXJZ17fT0flPV19HDhKJ"
-ctos_kml_path = "ctos.kml"
-
-# Configuração dos arquivos KML com suas respectivas cores e IDs
-KML_CONFIGS = {
-    "COOPER-COCAL": {
-        "file_id": "1XD-GgwgFgB2RcKkBAxf5RSBWu2yfIf2w",
-        "color": "#FF1493",
-        "path": "cooper_cocal.kml"
-    },
-    "COOPERA": {
-        "file_id": "1E5tKI5brZMo1rcrJANXggYegV1IrCdnv",
-        "color": "#00FF00",
-        "path": "coopera.kml"
-    },
-    "COPERALIANCA": {
-        "file_id": "1cDZwFpCDygrmZvP2_oSZoXT3oKXKT8Bh",
-        "color": "#0000FF",
-        "path": "coperalianca.kml"
-    },
-    "CERMOFUL": {
-        "file_id": "1r4gnRFaNUmAZ6f9oTdR1x9RcfksWTXDx",
-        "color": "#FF8C00",
-        "path": "cermoful.kml"
-    },
-    "CERTREL": {
-        "file_id": "1ZGczns-MIV897jQ8HRhH6LFgMRMdydm4",
-        "color": "#8A2BE2",
-        "path": "certrel.kml"
-    },
-    "FORÇALUZ": {
-        "file_id": "1CHAWKnha0C1f44uLJYXUOj0UcrtnlPKK",
-        "color": "#FFD700",
-        "path": "forcaluz.kml"
-    },
-    "CELESC": {
-        "file_id": "1M5P4_THpr1qxcxhPVOyQCdGTE5_7faRB",
-        "color": "#FF0000",
-        "path": "celesc.kml"
-    }
-}
-
 csv_ids = {
     "utp": "1UTp5gbAqppEhpIIp8qUvF83KARvwKego",
     "sem_viabilidade": "1Xo34rgfWQayl_4mJiPnTYlxWy356SpCK"
@@ -108,9 +62,6 @@ init_session_state()
 def coords_to_pluscode(lat, lon):
     return olc.encode(lat, lon)
 
-def validate_coordinates(lat: float, lon: float) -> bool:
-    return -90 <= lat <= 90 and -180 <= lon <= 180
-
 def format_distance(distance_m: float) -> str:
     if distance_m < 1000:
         return f"{distance_m:.1f}m"
@@ -122,111 +73,28 @@ def format_distance(distance_m: float) -> str:
 # ======================
 def on_refresh():
     st.cache_data.clear()
+    if refresh_cto_catalog() is None:
+        st.error("❌ Erro ao atualizar o catálogo de CTOs; a versão anterior continua em uso")
+    if refresh_project_lines() is None:
+        st.error("❌ Erro ao atualizar as linhas de projeto; a versão anterior continua em uso")
     st.session_state.refresh_clicked = True
     st.session_state.last_update = get_current_time()
     logger.info("Cache limpo e arquivos marcados para atualização")
 
-@st.cache_data(ttl=3600)
-def download_file(file_id: str, output: str) -> str:
-    try:
-        url = f"https://drive.google.com/uc?id={file_id}"
-        gdown.download(url, output, quiet=True)
-        logger.info(f"Arquivo {output} baixado com sucesso")
-        return output
-    except Exception as e:
-        logger.error(f"Erro ao baixar {output}: {e}")
-        raise Exception(f"Falha no download do arquivo {output}: {str(e)}")
-
-def load_lines_from_kml(path: str) -> List[List[Tuple[float, float]]]:
-    try:
-        namespaces = {'kml': 'http://www.opengis.net/kml/2.2'}
-        tree = ET.parse(path)
-        root = tree.getroot()
-        lines = []
-        for ls in root.findall(".//kml:LineString", namespaces):
-            coords_elem = ls.find("kml:coordinates", namespaces)
-            if coords_elem is not None and coords_elem.text:
-                try:
-                    raw = coords_elem.text.strip().split()
-                    coords = []
-                    for c in raw:
-                        parts = c.split(',')
-                        if len(parts) >= 2:
-                            lon, lat = float(parts[0]), float(parts[1])
-                            if validate_coordinates(lat, lon):
-                                coords.append((lat, lon))
-                    if len(coords) > 1:
-                        lines.append(coords)
-                except (ValueError, IndexError) as e:
-                    logger.warning(f"Linha KML inválida ignorada: {e}")
-                    continue
-        logger.info(f"Carregadas {len(lines)} linhas do KML {path}")
-        return lines
-    except Exception as e:
-        logger.error(f"Erro ao carregar KML: {e}")
-        raise Exception(f"Falha ao carregar arquivo KML: {str(e)}")
-
-@st.cache_data(ttl=3600)
-def load_ctos_from_kml(path: str) -> List[dict]:
-    try:
-        namespaces = {'kml': 'http://www.opengis.net/kml/2.2'}
-        tree = ET.parse(path)
-        root = tree.getroot()
-        ctos = []
-        for placemark in root.findall(".//kml:Placemark", namespaces):
-            name_elem = placemark.find("kml:name", namespaces)
-            desc_elem = placemark.find(".//kml:value", namespaces)
-            coords_elem = placemark.find(".//kml:coordinates", namespaces)
-            if coords_elem is not None and coords_elem.text:
-                parts = coords_elem.text.strip().split(",")
-                if len(parts) >= 2:
-                    lon, lat = float(parts[0]), float(parts[1])
-                    if validate_coordinates(lat, lon):
-                        ctos.append({
-                            "name": name_elem.text.strip() if name_elem is not None else "CTO",
-                            "desc": desc_elem.text.strip() if desc_elem is not None else "",
-                            "lat": lat,
-                            "lon": lon
-                        })
-        logger.info(f"Carregados {len(ctos)} CTOs do arquivo KML")
-        return ctos
-    except Exception as e:
-        logger.error(f"Erro ao carregar CTOs: {e}")
-        return []
-
 @st.cache_data(ttl=3600)
 def load_all_files():
     try:
-        download_file(csv_ids["utp"], csv_files["utp"])
-        download_file(csv_ids["sem_viabilidade"], csv_files["sem_viabilidade"])
-        download_file(file_id_ctos, ctos_kml_path)
-        
-        all_lines = {}
-        total_lines = 0
-        
-        for company, config in KML_CONFIGS.items():
-            try:
-                download_file(config["file_id"], config["path"])
-                lines = load_lines_from_kml(config["path"])
-                lines = [line for line in lines if line and len(line) > 1]
-                all_lines[company] = {
-                    "lines": lines,
-                    "color": config["color"],
-                    "count": len(lines)
-                }
-                total_lines += len(lines)
-                logger.info(f"Carregadas {len(lines)} linhas para {company}")
-            except Exception as e:
-                logger.error(f"Erro ao carregar {company}: {e}")
-                all_lines[company] = {"lines": [], "color": config["color"], "count": 0}
+        synced = sync_assets({name: (csv_ids[name], csv_files[name]) for name in csv_files})
+        faltando = [csv_files[name] for name in csv_files if name not in synced]
+        if faltando:
+            raise Exception(f"Falha no download do(s) arquivo(s) {', '.join(faltando)}")
         
         df_utp = pd.read_csv(csv_files["utp"])
         df_sem = pd.read_csv(csv_files["sem_viabilidade"])
-        ctos = load_ctos_from_kml(ctos_kml_path)
         
-        logger.info(f"Total: {total_lines} linhas, {len(ctos)} CTOs, {len(df_utp)} UTP, {len(df_sem)} sem viabilidade")
+        logger.info(f"Total: {len(df_utp)} UTP, {len(df_sem)} sem viabilidade")
         st.session_state.cache_timestamp = get_current_time()
-        return all_lines, ctos, df_utp, df_sem
+        return df_utp, df_sem
     except Exception as e:
         logger.error(f"Erro ao carregar arquivos: {e}")
         raise
@@ -234,96 +102,6 @@ def load_all_files():
 # ======================
 # Funções de Geolocalização
 # ======================
-def pluscode_to_coords(pluscode: str) -> Tuple[float, float]:
-    try:
-        pluscode = pluscode.strip().upper()
-        if not validate_plus_code(pluscode):
-            raise ValueError("Formato de Plus Code inválido")
-        if not olc.isFull(pluscode):
-            pluscode = olc.recoverNearest(pluscode, reference_lat, reference_lon)
-        decoded = olc.decode(pluscode)
-        lat = (decoded.latitudeLo + decoded.latitudeHi) / 2
-        lon = (decoded.longitudeLo + decoded.longitudeHi) / 2
-        if not validate_coordinates(lat, lon):
-            raise ValueError("Coordenadas resultantes inválidas")
-        return lat, lon
-    except Exception as e:
-        logger.error(f"Erro ao converter Plus Code {pluscode}: {e}")
-        raise Exception(f"Erro ao processar Plus Code: {str(e)}")
-
-@st.cache_data(ttl=1800)
-def reverse_geocode(lat: float, lon: float) -> str:
-    url = f"https://us1.locationiq.com/v1/reverse?key={LOCATIONIQ_KEY}&lat={lat}&lon={lon}&format=json"
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                display_name = data.get("display_name", "Endereço não encontrado")
-                return display_name
-            elif response.status_code == 429:
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                return f"Erro na consulta: HTTP {response.status_code}"
-        except requests.RequestException as e:
-            if attempt == max_retries - 1:
-                return f"Erro na consulta: {str(e)}"
-            time.sleep(1)
-    return "Erro na consulta após múltiplas tentativas"
-
-def find_nearest_ctos(lat: float, lon: float, ctos: List[dict], max_radius: float = 400.0) -> List[dict]:
-    if not ctos:
-        return []
-    dists = []
-    for cto in ctos:
-        if cto["name"].upper().startswith("CDOI"):
-            continue
-        dist = geodesic((lat, lon), (cto["lat"], cto["lon"])).meters
-        if dist <= max_radius:
-            dists.append({**cto, "distance": dist})
-    dists.sort(key=lambda x: x["distance"])
-    return dists
-
-@st.cache_data(ttl=3600)
-def get_walking_route(start_lat: float, start_lon: float, end_lat: float, end_lon: float) -> Optional[Dict]:
-    try:
-        url = f"http://router.project-osrm.org/route/v1/foot/{start_lon},{start_lat};{end_lon},{end_lat}"
-        params = {
-            "overview": "full",
-            "geometries": "geojson",
-            "steps": "false"
-        }
-        
-        response = requests.get(url, params=params, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("code") == "Ok" and data.get("routes") and len(data["routes"]) > 0:
-                route = data["routes"][0]
-                return {
-                    "distance": route["distance"],
-                    "duration": route["duration"],
-                    "geometry": route["geometry"]
-                }
-            else:
-                logger.warning(f"OSRM: Nenhuma rota encontrada")
-                return None
-        else:
-            logger.warning(f"OSRM API retornou status {response.status_code}")
-            return None
-            
-    except requests.Timeout:
-        logger.error("OSRM: Timeout na requisição")
-        return None
-    except requests.RequestException as e:
-        logger.error(f"Erro ao consultar OSRM API: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"Erro inesperado na rota: {e}")
-        return None
-
 def format_duration(seconds: float) -> str:
     if seconds < 60:
         return f"{int(seconds)}s"
@@ -362,6 +140,18 @@ with st.sidebar:
         on_refresh()
     if st.session_state.cache_timestamp:
         st.info(f"📅 Última atualização: {datetime.now(TIMEZONE_BR).strftime('%d/%m/%Y %H:%M')}")
+    stats_dist = distance_cache.stats()
+    stats_rota = route_cache.stats()
+    st.caption(
+        f"🗄️ Cache de rotas: {stats_dist['entries'] + stats_rota['entries']} entradas | "
+        f"acertos {stats_dist['hit_rate']:.0%} (distâncias), {stats_rota['hit_rate']:.0%} (rotas)"
+    )
+    stats_osrm = routing_stats()
+    latencias = " | ".join(
+        f"{servico}: p50 {lat['p50']:.2f}s, p90 {lat['p90']:.2f}s"
+        for servico, lat in stats_osrm["latencias"].items()
+    )
+    st.caption(f"🛰️ OSRM: circuito {stats_osrm['circuito']}" + (f" | {latencias}" if latencias else ""))
 
 if st.session_state.refresh_clicked:
     st.success("✅ Arquivos atualizados com sucesso!")
@@ -369,7 +159,9 @@ if st.session_state.refresh_clicked:
 
 try:
     with st.spinner("Carregando arquivos..."):
-        all_lines, ctos, df_utp, df_sem = load_all_files()
+        df_utp, df_sem = load_all_files()
+        cto_catalog = get_cto_catalog()
+        project_lines = get_project_lines()
 except Exception as e:
     st.error(f"❌ Erro ao carregar arquivos: {e}")
     st.stop()
@@ -388,6 +180,30 @@ else:
     st.subheader(f"📋 {len(ftth_pending)} Solicitação(ões) FTTH Aguardando Busca")
     st.markdown("---")
     
+    # Resultados pré-calculados ao criar a solicitação
+    precalculados = {
+        request['id']: get_precomputed(request['id'], request['plus_code_cliente'], compute=False)
+        for request in ftth_pending
+    }
+    
+    # Candidatas do restante da fila em uma única passada (memorizadas por solicitação)
+    # e endereços de todos os cards pedidos de uma vez: a página espera no
+    # máximo GEOCODE_WAIT no total, não por card
+    pending_points = []
+    enderecos = {}
+    for request in ftth_pending:
+        precalculado = precalculados[request['id']]
+        try:
+            lat, lon = pluscode_to_coords(request['plus_code_cliente'])
+        except Exception:
+            continue  # O erro é exibido no card da solicitação
+        if not precalculado:
+            pending_points.append((request['id'], lat, lon))
+        if not (precalculado and precalculado["endereco"]):
+            enderecos[request['id']] = lookup_address_async(lat, lon)
+    candidates_by_request = cto_catalog.candidates_for_requests(pending_points, max_radius=3500.0)
+    prazo_enderecos = time.monotonic() + GEOCODE_WAIT
+    
     for request in ftth_pending:
         plus_code_input = request['plus_code_cliente']
         urgente = request.get('urgente', False)
@@ -425,8 +241,12 @@ else:
                     st.text(f"Usuário: {request['usuario']}")
                 
                 with col_info2:
+                    precalculado = precalculados[request['id']]
                     with st.spinner("Buscando endereço..."):
-                        endereco = reverse_geocode(lat, lon)
+                        if precalculado and precalculado["endereco"]:
+                            endereco = precalculado["endereco"]
+                        else:
+                            endereco = pending_address(enderecos[request['id']], prazo_enderecos - time.monotonic())
                         endereco_simples = ", ".join(endereco.split(",")[:3])
                     st.text(f"Endereço:")
                     st.caption(endereco_simples)
@@ -435,42 +255,26 @@ else:
                     st.markdown(f"[🗺️ Abrir no Google Maps]({maps_url})")
             
             # Buscar CTOs próximas
-            candidate_ctos = find_nearest_ctos(lat, lon, ctos, max_radius=3500.0)
-            
-            cto_routes = []
-            if candidate_ctos:
-                with st.spinner("🗺️ Calculando rotas para CTOs..."):
-                    for cto in candidate_ctos[:10]:
-                        route = get_walking_route(lat, lon, cto["lat"], cto["lon"])
-                        
-                        if route:
-                            linha_reta = geodesic((lat, lon), (cto["lat"], cto["lon"])).meters
-                            if route["distance"] > linha_reta * 5:
-                                route["distance"] = linha_reta
-                            
-                            cto_routes.append({
-                                "cto": cto,
-                                "route": route,
-                                "distance": route["distance"]
-                            })
-                        else:
-                            cto_routes.append({
-                                "cto": cto,
-                                "route": None,
-                                "distance": cto["distance"]
-                            })
-                    
-                    cto_routes.sort(key=lambda x: x["distance"])
-                    cto_routes = cto_routes[:5]  # Apenas 5 mais próximas
+            if precalculado:
+                cto_routes = precalculado["cto_routes"]
+                linhas_proximas = precalculado["linhas"]
+            else:
+                candidate_ctos = candidates_by_request.get(request['id'], [])
+                cto_routes = []
+                if candidate_ctos:
+                    with st.spinner("🗺️ Calculando rotas para CTOs..."):
+                        cto_routes = rank_ctos_by_route(lat, lon, candidate_ctos)
+                linhas_proximas = project_lines.index.nearest_sorted(lat, lon)
             
             # CTOs mais próximas
             if cto_routes:
                 st.markdown("### 🛠 CTOs Mais Próximas - Escolha uma")
+                st.caption(f"📐 Rede de projeto mais próxima: {format_line_proximity(linhas_proximas)}")
                 
                 for idx, item in enumerate(cto_routes):
                     cto = item["cto"]
                     route = item["route"]
-                    pluscode_cto = coords_to_pluscode(cto["lat"], cto["lon"])
+                    pluscode_cto = cto["pluscode"]
                     
                     # Ícone baseado na posição
                     icons = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣"]
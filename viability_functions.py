@@ -10,7 +10,6 @@ from typing import Dict, List, Optional
 from supabase_config import supabase
 from notifier import notify_new_viability, notify_new_agenda_data
 import pytz
-import re
 import pandas as pd
 
 logger = logging.getLogger(__name__)
@@ -27,10 +26,6 @@ def get_current_time():
 # ======================
 # Funções Utilitárias
 # ======================
-def validate_plus_code(plus_code: str) -> bool:
-    pattern = r'^[23456789CFGHJMPQRVWX]{4,8}\+[23456789CFGHJMPQRVWX]{2,3}$'
-    return bool(re.match(pattern, plus_code.upper().strip()))
-
 def format_time_br(iso_string: str, only_time: bool = False) -> str:
     """Converte string ISO em formato legível no fuso horário de Brasília"""
     if not iso_string:
@@ -158,6 +153,15 @@ def create_viability_request(user_name: str, plus_code: str, tipo: str, urgente:
         if response.data:
             logger.info(f"Viabilização criada: {user_name} - {plus_code} - Tipo: {tipo} - Urgente: {urgente}")
            
+            # Pré-calcular CTOs candidatas em segundo plano para a auditoria
+            # (importado aqui: só quem cria solicitações carrega o pré-cálculo)
+            from precompute import PRECOMPUTE_TYPES, enqueue_precompute
+            if tipo in PRECOMPUTE_TYPES:
+                try:
+                    enqueue_precompute(response.data[0]['id'], plus_code)
+                except Exception as e:
+                    logger.warning(f"Não foi possível agendar o pré-cálculo: {e}")
+
             # 🚀 Enviar notificação via Telegram ao criar nova solicitação
             try:                
                 notify_new_viability()